@@ -1,65 +1,115 @@
-import re
+import random
 from pathlib import Path
 
+import numpy as np
+
 # IN_FILE = Path("./demo_input.txt")
 IN_FILE = Path("./full_input.txt")
 LOCK_RING = 100
+START_STATE = 50
+
+# Lookup table of `10**place` for every decimal place of an int64
+POWERS_OF_10 = 10 ** np.arange(19, dtype=np.int64)
+
+
+def read_rotations() -> np.ndarray:
+    """Load every rotation at once as a signed int64 array, with left rotations negative.
+
+    The digits are parsed in bulk as well: every digit contributes `digit * 10**place`
+    to the rotation of its line, where `place` counts the digits after it on that line."""
+    buf = np.frombuffer(IN_FILE.read_bytes(), dtype=np.uint8)
+
+    # Every line starts with its direction, followed by its digits
+    line_starts = np.flatnonzero((buf == ord("L")) | (buf == ord("R")))
+    is_digit = (buf >= ord("0")) & (buf <= ord("9"))
+    digit_pos = np.flatnonzero(is_digit)
+
+    # Index in to `digit_pos` of the first digit of every line and the digit counts
+    first_digits = np.cumsum(is_digit)[line_starts]
+    n_digits = np.diff(first_digits, append=len(digit_pos))
+
+    last_digit_pos = digit_pos[first_digits + n_digits - 1]
+    places = np.repeat(last_digit_pos, n_digits) - digit_pos
+    digits = (buf[digit_pos] - ord("0")).astype(np.int64)
+    rotations = np.add.reduceat(digits * POWERS_OF_10[places], first_digits)
+
+    # Left rotation subtracts
+    return np.where(buf[line_starts] == ord("L"), -rotations, rotations)
 
 
 def part1():
-    password = 0
-    lock_state = 50
+    rotations = read_rotations()
 
-    pattern = re.compile(r"([LR])(\d+)")
-    for line in IN_FILE.open("r"):
-        # Strip any trailing newlines
-        line = line.rstrip("\n")
+    # Be sure to handle the ring by using modulus
+    lock_states = (START_STATE + np.cumsum(rotations)) % LOCK_RING
 
-        m = pattern.fullmatch(line)
-        assert m
+    # Increment `password` every time the `lock_state` is 0
+    password = np.count_nonzero(lock_states == 0)
 
-        # Left rotation subtracts
-        if m.group(1) == "L":
-            lock_state -= int(m.group(2))
-        else:
-            lock_state += int(m.group(2))
+    print(f"Part1 Password is: {password}")
 
-        # Be sure to handle the ring by using modulus
-        lock_state = lock_state % LOCK_RING
 
-        # Increment `password` every time the `lock_state` is 0
+def count_zero_clicks(
+    lock_state: np.ndarray | int, rotation: np.ndarray | int, ring: np.ndarray | int = LOCK_RING
+) -> np.ndarray:
+    """How many clicks of a `rotation` land on 0, starting from `lock_state`.
+
+    Unwrapping the dial, the clicks pass through the positions between `lock_state` and
+    `lock_state + rotation`, and the multiples of `ring` among them are the zeros. The
+    starting position itself is not a click, while the final one is. Works elementwise
+    on arrays, and only depends on `lock_state` through floor division by `ring`, so it
+    may be unwrapped as well."""
+    end_state = lock_state + rotation
+    return np.where(
+        rotation >= 0,
+        # The multiples of `ring` in `(lock_state, end_state]`
+        end_state // ring - lock_state // ring,
+        # The multiples of `ring` in `[end_state, lock_state)`
+        (lock_state - 1) // ring - (end_state - 1) // ring,
+    )
+
+
+def count_zero_clicks_stepwise(lock_state: int, rotation: int, ring: int = LOCK_RING) -> int:
+    """Reference for `count_zero_clicks` that turns the dial one click at a time."""
+    zero_clicks = 0
+    sign = -1 if rotation < 0 else 1
+    for _ in range(abs(rotation)):
+        lock_state = (lock_state + sign) % ring
         if lock_state == 0:
-            password += 1
+            zero_clicks += 1
 
-    print(f"Part1 Password is: {password}")
+    return zero_clicks
+
+
+def check_zero_clicks(n_trials: int = 100_000, seed: int = 0):
+    """Cross-check `count_zero_clicks` against the stepwise reference on random rotations."""
+    rng = random.Random(seed)
+    rings = [rng.randint(1, 200) for _ in range(n_trials)]
+    lock_states = [rng.randrange(ring) for ring in rings]
+    rotations = [rng.randint(-5 * ring, 5 * ring) for ring in rings]
+
+    expected = [
+        count_zero_clicks_stepwise(lock_state, rotation, ring)
+        for lock_state, rotation, ring in zip(lock_states, rotations, rings, strict=True)
+    ]
+    actual = count_zero_clicks(np.array(lock_states), np.array(rotations), np.array(rings))
+
+    mismatches = np.flatnonzero(actual != np.array(expected))
+    assert not len(mismatches), [
+        (lock_states[i], rotations[i], rings[i], actual[i], expected[i]) for i in mismatches[:5]
+    ]
+
+    print(f"All {n_trials} random rotations agree")
 
 
 def part2():
-    password = 0
-    lock_state = 50
-
-    pattern = re.compile(r"([LR])(\d+)")
-    for line in IN_FILE.open("r"):
-        # Strip any trailing newlines
-        line = line.rstrip("\n")
-
-        m = pattern.fullmatch(line)
-        assert m
-        direction = m.group(1)
-        spin_amount = int(m.group(2))
-
-        # Left rotation subtracts
-        sign = -1 if direction == "L" else 1
-
-        for _ in range(spin_amount):
-            lock_state += sign
-            if lock_state == -1:
-                lock_state = 99
-            if lock_state == 100:
-                lock_state = 0
-
-            if lock_state == 0:
-                password += 1
+    rotations = read_rotations()
+
+    # The unwrapped dial before and after every rotation
+    end_states = START_STATE + np.cumsum(rotations)
+    start_states = end_states - rotations
+
+    password = count_zero_clicks(start_states, rotations).sum()
 
     print(f"Part2 Password is: {password}")
 
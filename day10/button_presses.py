@@ -1,16 +1,38 @@
+import math
+import os
 import re
+import time
 from collections import deque
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from fractions import Fraction
 from pathlib import Path
 
+import numpy as np
 import pulp as pl
+from ortools.linear_solver import pywraplp
+from ortools.sat.python import cp_model
 
 # IN_FILE = Path("./demo_input.txt")
 IN_FILE = Path("./full_input.txt")
 
+# Number of worker processes evaluating the machines
+N_WORKERS = os.cpu_count() or 1
+
+# Number of machines handed to a worker at a time
+CHUNK_SIZE = 8
+
+# The engine solving the part 2 joltages, see `JOLTAGE_ENGINES`
+JOLTAGE_ENGINE = "cp_sat"
+
 # Tell the solver to not log
 no_log_solver = pl.PULP_CBC_CMD(msg=False)
 
 
+# Tolerance on the floating point LP relaxation in `Machine.configure_joltages_exact`
+LP_EPS = 1e-6
+
+
 class Machine:
     def __init__(self, configuration: str) -> None:
         # Extract the goal state
@@ -40,29 +62,27 @@ class Machine:
 
         self.target_joltages = tuple(target_joltages)
 
-    @staticmethod
-    def _toggle_indicators(indicators: tuple[int, ...], button: tuple[int, ...]) -> tuple[int, ...]:
-        """Toggles the input `indicators` according to the `button`."""
-        return tuple(
-            indicators[i] ^ 1 if i in button else indicators[i] for i in range(len(indicators))
-        )
+        # Indicators and buttons as bitmasks where bit `i` is indicator `i`. Pressing
+        # a button toggles its indicators, which is a single XOR
+        self.target_mask = sum(t << i for i, t in enumerate(self.target_state))
+        self.button_masks = [sum(1 << i for i in button) for button in self.buttons]
 
     def turn_on(self) -> int:
         seen = set()
 
         # The initial state is all off with 0 button presses
-        states = deque([((0,) * len(self.target_state), 0)])
+        states = deque([(0, 0)])
 
         while states:
             indicators, n_presses = states.popleft()
 
-            # Exit early once the first state matches the `self.target_state`
-            if indicators == self.target_state:
+            # Exit early once the first state matches the `self.target_mask`
+            if indicators == self.target_mask:
                 return n_presses
 
             # Press each button and add to the `states`
-            for button in self.buttons:
-                next_indicators = self._toggle_indicators(indicators, button)
+            for button_mask in self.button_masks:
+                next_indicators = indicators ^ button_mask
 
                 # Avoid continuing BFS on already seen indicator states since we
                 # know that any further digging in this direction will never produce
@@ -74,6 +94,62 @@ class Machine:
         # There should always be a way to turn on the machine
         raise AssertionError()
 
+    def turn_on_gf2(self) -> int:
+        """Solve `turn_on` as a linear system over GF(2) instead of searching the states.
+
+        Pressing a button twice undoes it, so each button is pressed 0 or 1 times and the
+        presses must XOR to the target. Gaussian elimination finds one solution and a basis
+        of the null space, and the minimum is found among the `2^n_free` solutions. This is
+        polynomial in the number of buttons, apart from the free variables."""
+        n_buttons = len(self.button_masks)
+
+        # One equation per indicator: a bitmask of the buttons toggling it and the target bit
+        equations = []
+        for i in range(len(self.target_state)):
+            coeffs = sum(1 << b for b, mask in enumerate(self.button_masks) if mask >> i & 1)
+            equations.append([coeffs, self.target_mask >> i & 1])
+
+        # Reduce to reduced row echelon form, recording the pivot column of each row
+        pivot_cols = []
+        for col in range(n_buttons):
+            rank = len(pivot_cols)
+            pivot = next(
+                (r for r in range(rank, len(equations)) if equations[r][0] >> col & 1), None
+            )
+            if pivot is None:
+                continue
+
+            equations[rank], equations[pivot] = equations[pivot], equations[rank]
+            for r, equation in enumerate(equations):
+                if r != rank and equation[0] >> col & 1:
+                    equation[0] ^= equations[rank][0]
+                    equation[1] ^= equations[rank][1]
+            pivot_cols.append(col)
+
+        # There should always be a way to turn on the machine, so no `0 = 1` rows remain
+        assert not any(rhs for _, rhs in equations[len(pivot_cols) :])
+
+        # Setting every free button to 0 gives one solution
+        solution = sum(equations[r][1] << col for r, col in enumerate(pivot_cols))
+
+        # Pressing a free button forces the pivot buttons of the rows that contain it
+        null_basis = []
+        for free_col in sorted(set(range(n_buttons)) - set(pivot_cols)):
+            vector = 1 << free_col
+            for r, col in enumerate(pivot_cols):
+                if equations[r][0] >> free_col & 1:
+                    vector |= 1 << col
+            null_basis.append(vector)
+
+        # Walk every combination of the null space in Gray code order, so each step
+        # is a single XOR
+        min_presses = solution.bit_count()
+        for step in range(1, 1 << len(null_basis)):
+            solution ^= null_basis[(step & -step).bit_length() - 1]
+            min_presses = min(min_presses, solution.bit_count())
+
+        return min_presses
+
     # @line_profiler.profile
     def configure_joltages(self) -> int:
         # Each button is its own LP variable
@@ -107,26 +183,403 @@ class Machine:
         # values as floats due to solver internals. Round as a result to convert to an int.
         return sum(round(b.value()) for b in buttons_lp)
 
+    def configure_joltages_exact(self, time_budget: float | None = None) -> int | None:
+        """`configure_joltages` with exact integer arithmetic, without an external solver.
+
+        Gaussian elimination over the rationals expresses every pivot button in terms of
+        the free buttons. The free buttons are then branched and bounded within their
+        bounds from `self.target_joltages`, propagating those bounds through every pivot
+        row and, once a solution is known, through the objective as well. What is left
+        of each branch is bounded from below by its LP relaxation, solved with GLOP.
+
+        Returns `None` if the search runs past the `time_budget` in seconds."""
+        # Pressing either of two identical buttons does the same, so only keep one of each
+        buttons = list(dict.fromkeys(tuple(sorted(button)) for button in self.buttons))
+        n_buttons = len(buttons)
+
+        # The augmented matrix `[A | b]` of `A x = b`, with one row per joltage
+        rows = [
+            [Fraction(int(j in button)) for button in buttons] + [Fraction(target_joltage)]
+            for j, target_joltage in enumerate(self.target_joltages)
+        ]
+
+        # Reduce to reduced row echelon form, recording the pivot column of each row
+        pivot_cols = []
+        for col in range(n_buttons):
+            rank = len(pivot_cols)
+            pivot = next((r for r in range(rank, len(rows)) if rows[r][col]), None)
+            if pivot is None:
+                continue
+
+            rows[rank], rows[pivot] = rows[pivot], rows[rank]
+            rows[rank] = [v / rows[rank][col] for v in rows[rank]]
+            for r, row in enumerate(rows):
+                if r != rank and row[col]:
+                    rows[r] = [v - row[col] * pv for v, pv in zip(row, rows[rank], strict=True)]
+            pivot_cols.append(col)
+
+        # There should always be a way to reach the joltages, so no `0 = b` rows remain
+        assert not any(row[-1] for row in rows[len(pivot_cols) :])
+
+        free_cols = sorted(set(range(n_buttons)) - set(pivot_cols))
+        bounds = [min(self.target_joltages[j] for j in buttons[f]) for f in free_cols]
+
+        # Scale every pivot row to integers: `scale * x_pivot = rhs - sum(coeffs * x_free)`.
+        # With `0 <= x_pivot <= pivot_bound`, that confines `sum(coeffs * x_free)` to
+        # `[rhs - scale * pivot_bound, rhs]`
+        pivot_rows = []
+        for r, col in enumerate(pivot_cols):
+            scale = math.lcm(*(v.denominator for v in rows[r]))
+            rhs = int(rows[r][-1] * scale)
+            coeffs = [int(rows[r][f] * scale) for f in free_cols]
+            pivot_bound = min(self.target_joltages[j] for j in buttons[col])
+            pivot_rows.append((scale, rhs, coeffs, rhs - scale * pivot_bound))
+
+        # The objective `sum(x)` as an integer linear function of the free buttons, scaled by
+        # `common`: `common * sum(x) = obj_const + sum(obj_weights * x_free)`
+        common = math.lcm(*(scale for scale, _, _, _ in pivot_rows))
+        obj_const = sum(rhs * (common // scale) for scale, rhs, _, _ in pivot_rows)
+        obj_weights = [
+            common - sum(coeffs[i] * (common // scale) for scale, _, coeffs, _ in pivot_rows)
+            for i in range(len(free_cols))
+        ]
+
+        # Every pivot row as a constraint `lower <= sum(coeffs * x_free) <= upper`
+        constraints = [(coeffs, row_lo, rhs) for _, rhs, coeffs, row_lo in pivot_rows]
+        obj_floor = sum(min(0, w * b) for w, b in zip(obj_weights, bounds, strict=True))
+
+        def propagate(lo: list[int], hi: list[int], constraints: list) -> bool:
+            """Tighten the free button ranges `[lo, hi]` in place against the `constraints`.
+
+            Returns `False` if some constraint can no longer be met."""
+            changed = True
+            while changed:
+                changed = False
+                for coeffs, lower, upper in constraints:
+                    terms = [
+                        (c * lo[i], c * hi[i]) if c > 0 else (c * hi[i], c * lo[i])
+                        for i, c in enumerate(coeffs)
+                    ]
+                    min_sum = sum(t[0] for t in terms)
+                    max_sum = sum(t[1] for t in terms)
+                    if min_sum > upper or max_sum < lower:
+                        return False
+
+                    for i, c in enumerate(coeffs):
+                        if c == 0 or lo[i] == hi[i]:
+                            continue
+
+                        # The range of `c * x_i` that the rest of the row leaves open
+                        c_upper = upper - (min_sum - terms[i][0])
+                        c_lower = lower - (max_sum - terms[i][1])
+                        if c > 0:
+                            new_lo, new_hi = -(-c_lower // c), c_upper // c
+                        else:
+                            new_lo, new_hi = -(-c_upper // c), c_lower // c
+
+                        if new_lo > lo[i] or new_hi < hi[i]:
+                            lo[i], hi[i] = max(lo[i], new_lo), min(hi[i], new_hi)
+                            if lo[i] > hi[i]:
+                                return False
+                            changed = True
+            return True
+
+        # The LP relaxation over the free buttons, solved with GLOP. Only the variable bounds
+        # change between the nodes of the search, so the solver is built once and reused
+        lp = pywraplp.Solver.CreateSolver("GLOP")
+        assert lp is not None
+        lp_vars = [lp.NumVar(0, bound, "") for bound in bounds]
+        for coeffs, lower, upper in constraints:
+            lp_row = lp.Constraint(lower, upper)
+            for var, c in zip(lp_vars, coeffs, strict=True):
+                lp_row.SetCoefficient(var, c)
+
+        lp_objective = lp.Objective()
+        lp_objective.SetOffset(obj_const)
+        for var, w in zip(lp_vars, obj_weights, strict=True):
+            lp_objective.SetCoefficient(var, w)
+        lp_objective.SetMinimization()
+
+        coeffs_matrix = np.array([coeffs for coeffs, _, _ in constraints]).reshape(
+            len(constraints), len(free_cols)
+        )
+        lowers = np.array([lower for _, lower, _ in constraints])
+        uppers = np.array([upper for _, _, upper in constraints])
+
+        # The best objective found so far, scaled by `common` like `objective`
+        best: int | None = None
+
+        def objective(z: list[int]) -> int:
+            return obj_const + sum(w * x for w, x in zip(obj_weights, z, strict=True))
+
+        def is_integral(z: list[int]) -> bool:
+            """Whether every pivot button comes out as a whole number of presses."""
+            return all(
+                (rhs - sum(c * x for c, x in zip(coeffs, z, strict=True))) % scale == 0
+                for scale, rhs, coeffs, _ in pivot_rows
+            )
+
+        def search(lo: list[int], hi: list[int]):
+            nonlocal best
+
+            if deadline is not None and time.perf_counter() > deadline:
+                raise TimeoutError()
+
+            # Once there is a solution, only look for strictly better ones. The objective
+            # only takes multiples of `common`, so that takes at least `common` less
+            bounded = constraints
+            if best is not None:
+                bounded = [*constraints, (obj_weights, obj_floor, best - common - obj_const)]
+            if not propagate(lo, hi, bounded):
+                return
+
+            unassigned = [i for i in range(len(free_cols)) if lo[i] < hi[i]]
+            if not unassigned:
+                if is_integral(lo) and (best is None or objective(lo) < best):
+                    best = objective(lo)
+                return
+
+            # Bound the objective from below by the LP relaxation of what is left
+            for var, var_lo, var_hi in zip(lp_vars, lo, hi, strict=True):
+                var.SetBounds(var_lo, var_hi)
+            status = lp.Solve()
+            if status == pywraplp.Solver.INFEASIBLE:
+                return
+            assert status == pywraplp.Solver.OPTIMAL
+
+            # The objective only takes multiples of `common`, so round the bound up to one
+            lp_bound = common * math.ceil(lp_objective.Value() / common - LP_EPS)
+            if best is not None and lp_bound >= best:
+                return
+
+            z = np.array([var.solution_value() for var in lp_vars])
+
+            # The LP minimum is attained by whole numbers of presses, so nothing here beats it
+            z_rounded = [round(v) for v in z]
+            fractional = [i for i in unassigned if abs(z[i] - z_rounded[i]) > LP_EPS]
+            if not fractional and is_integral(z_rounded):
+                best = objective(z_rounded)
+                return
+
+            # How many pivot rows each free button takes part in that the LP solution
+            # pushes right up against one of their bounds
+            activity = coeffs_matrix @ z
+            tight_rows = (np.abs(activity - lowers) <= LP_EPS * common) | (
+                np.abs(activity - uppers) <= LP_EPS * common
+            )
+            n_tight = (coeffs_matrix[tight_rows] != 0).sum(axis=0)
+
+            # Branch on the most constrained button, preferring any with a fractional
+            # number of presses in the LP solution, and then on the fewest options
+            i = max(fractional or unassigned, key=lambda i: (n_tight[i], -(hi[i] - lo[i])))
+
+            # Split the presses around the LP solution, trying its side first
+            split = min(max(math.floor(z[i] + LP_EPS), lo[i]), hi[i])
+            if fractional:
+                branches = [(lo[i], split), (split + 1, hi[i])]
+                if z[i] - split > 0.5:
+                    branches.reverse()
+            else:
+                branches = [(split, split), (lo[i], split - 1), (split + 1, hi[i])]
+
+            for branch_lo, branch_hi in branches:
+                if branch_lo <= branch_hi:
+                    search(
+                        lo[:i] + [branch_lo] + lo[i + 1 :],
+                        hi[:i] + [branch_hi] + hi[i + 1 :],
+                    )
+
+        deadline = None if time_budget is None else time.perf_counter() + time_budget
+        try:
+            search([0] * len(free_cols), bounds)
+        except TimeoutError:
+            return None
+
+        # There should always be a way to reach the joltages
+        assert best is not None
+        return best // common
+
+    def add_joltage_block(self, model: cp_model.CpModel) -> list[cp_model.IntVar]:
+        """Add this machine's `configure_joltages` constraints to a shared CP-SAT `model`.
+
+        Returns the button press variables so the caller can build the objective."""
+        # A button can be pressed at most as many times as its smallest joltage allows
+        buttons_cp = [
+            model.new_int_var(0, min(self.target_joltages[j] for j in button), "")
+            for button in self.buttons
+        ]
+
+        # The buttons that have `j` must add up to the `target_joltage`
+        for j, target_joltage in enumerate(self.target_joltages):
+            model.add(
+                cp_model.LinearExpr.Sum(
+                    [b for b, button in zip(buttons_cp, self.buttons, strict=True) if j in button]
+                )
+                == target_joltage
+            )
+
+        return buttons_cp
 
-def part1():
-    machines = []
-    with IN_FILE.open("r") as f:
-        for config_line in f:
-            machines.append(Machine(config_line))
 
-    print(f"Part 1 minimum turn on presses: {sum(m.turn_on() for m in machines)}")
+def configure_joltages_batch(
+    machines: list[Machine], n_search_workers: int | None = None
+) -> list[int]:
+    """`Machine.configure_joltages` for every machine, solved in-process in one go.
 
+    The machines are independent, so their constraints form the blocks of one
+    block-diagonal CP-SAT model and minimizing the total minimizes every block. This
+    avoids writing out a model and launching a solver subprocess per machine."""
+    model = cp_model.CpModel()
+    blocks = [machine.add_joltage_block(model) for machine in machines]
+    model.minimize(cp_model.LinearExpr.Sum([b for block in blocks for b in block]))
 
-def part2():
+    solver = cp_model.CpSolver()
+    if n_search_workers is not None:
+        solver.parameters.num_workers = n_search_workers
+    status = solver.Solve(model)
+    assert status == cp_model.OPTIMAL
+
+    return [sum(solver.Value(b) for b in block) for block in blocks]
+
+
+def read_input_data() -> list[Machine]:
     machines = []
     with IN_FILE.open("r") as f:
         for config_line in f:
             machines.append(Machine(config_line))
 
-    print(f"Part 2 minimum joltage presses: {sum(m.configure_joltages() for m in machines)}")
+    return machines
+
+
+# The machines of the worker process, set once by `_init_worker`
+_worker_machines: list[Machine] = []
+_worker_search_threads = 1
+
+
+def _init_worker(machines: list[Machine], n_search_threads: int):
+    global _worker_machines, _worker_search_threads
+    _worker_machines = machines
+    _worker_search_threads = n_search_threads
+
+
+def _turn_on_chunk(start: int, stop: int) -> list[int]:
+    return [machine.turn_on_gf2() for machine in _worker_machines[start:stop]]
+
+
+def _configure_joltages_chunk(start: int, stop: int) -> list[int]:
+    return configure_joltages_batch(
+        _worker_machines[start:stop], n_search_workers=_worker_search_threads
+    )
+
+
+def _configure_joltages_exact_chunk(start: int, stop: int) -> list[int]:
+    presses = []
+    for machine in _worker_machines[start:stop]:
+        n_presses = machine.configure_joltages_exact()
+
+        # Without a time budget the exact engine always finishes
+        assert n_presses is not None
+        presses.append(n_presses)
+
+    return presses
+
+
+# Engines that solve the part 2 joltages of a chunk of machines, selectable by name
+JOLTAGE_ENGINES: dict[str, Callable[[int, int], list[int]]] = {
+    "cp_sat": _configure_joltages_chunk,
+    "exact": _configure_joltages_exact_chunk,
+}
+
+
+def machine_pool(machines: list[Machine], n_workers: int = N_WORKERS) -> ProcessPoolExecutor:
+    """A process pool whose workers each receive the `machines` once, up front.
+
+    Tasks then only refer to the machines by index, so the pool can be reused for
+    both parts without sending the machines again."""
+    # Split the cores between the workers rather than oversubscribing them
+    n_search_threads = max(1, (os.cpu_count() or 1) // n_workers)
+    return ProcessPoolExecutor(
+        max_workers=n_workers,
+        initializer=_init_worker,
+        initargs=(machines, n_search_threads),
+    )
+
+
+def evaluate_machines(
+    chunk_task: Callable[[int, int], list[int]],
+    n_machines: int,
+    pool: ProcessPoolExecutor,
+    chunk_size: int = CHUNK_SIZE,
+) -> list[int]:
+    """Run `chunk_task` over the machines `chunk_size` at a time, returning the results in
+    the order of the machines."""
+    starts = range(0, n_machines, chunk_size)
+    stops = [min(start + chunk_size, n_machines) for start in starts]
+    return [result for chunk in pool.map(chunk_task, starts, stops) for result in chunk]
+
+
+def _part1(n_machines: int, pool: ProcessPoolExecutor):
+    presses = evaluate_machines(_turn_on_chunk, n_machines, pool)
+
+    print(f"Part 1 minimum turn on presses: {sum(presses)}")
+
+
+def part1(n_workers: int = N_WORKERS):
+    machines = read_input_data()
+
+    with machine_pool(machines, n_workers) as pool:
+        _part1(len(machines), pool)
+
+
+def check_joltages(time_budget: float | None = 10.0):
+    """Cross-check `Machine.configure_joltages_exact` against the PuLP `configure_joltages`.
+
+    The exact engine gets a per-machine `time_budget` in seconds so the check cannot hang.
+    Run it from this directory with:
+
+        python -c "import button_presses; button_presses.check_joltages()"
+    """
+    machines = read_input_data()
+
+    results = {}
+    for name, configure in (
+        ("exact", lambda machine: machine.configure_joltages_exact(time_budget)),
+        ("pulp", Machine.configure_joltages),
+    ):
+        start = time.perf_counter()
+        results[name] = [configure(machine) for machine in machines]
+        print(f"{name}: {time.perf_counter() - start:.2f} s")
+
+    undecided = [i for i, presses in enumerate(results["exact"]) if presses is None]
+    mismatches = [
+        i
+        for i, (a, b) in enumerate(zip(results["exact"], results["pulp"], strict=True))
+        if a is not None and a != b
+    ]
+    print(f"Machines the exact engine left undecided within the time budget: {undecided}")
+    print(f"Machines where the engines disagree: {mismatches}")
+
+
+def _part2(n_machines: int, pool: ProcessPoolExecutor, engine: str = JOLTAGE_ENGINE):
+    if engine not in JOLTAGE_ENGINES:
+        raise ValueError(f"Unknown engine {engine!r}, expected one of {list(JOLTAGE_ENGINES)}")
+
+    presses = evaluate_machines(JOLTAGE_ENGINES[engine], n_machines, pool)
+
+    print(f"Part 2 minimum joltage presses: {sum(presses)}")
+
+
+def part2(n_workers: int = N_WORKERS, engine: str = JOLTAGE_ENGINE):
+    machines = read_input_data()
+
+    with machine_pool(machines, n_workers) as pool:
+        _part2(len(machines), pool, engine)
 
 
 if __name__ == "__main__":
-    part1()
+    # Share one pool between both parts so the machines are only parsed and sent once
+    machines = read_input_data()
+    with machine_pool(machines) as pool:
+        _part1(len(machines), pool)
 
-    part2()
+        _part2(len(machines), pool)
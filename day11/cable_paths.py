@@ -1,130 +1,131 @@
+import math
 import re
-from collections import Counter, defaultdict, deque
-from copy import deepcopy
-from itertools import chain
+from itertools import pairwise, permutations
 from pathlib import Path
 
+import numpy as np
+
 # IN_FILE = Path('./demo_input.txt')
 # IN_FILE = Path('./demo_input2.txt')
 IN_FILE = Path("./full_input.txt")
 
 
-def scale_counter(counter: Counter, k: int) -> Counter:
-    return Counter({key: count * k for key, count in counter.items()})
+class Graph:
+    """A directed graph in compressed sparse row form over the integer node IDs `0..n-1`.
 
+    The children of node `i` are `indices[indptr[i] : indptr[i + 1]]`, repeated once for
+    every edge to them. `names` maps the IDs back to the node names and `ids` vice versa."""
 
-def reverse_fill_graph(
-    graph: defaultdict[str, list[str]],
-    *,
-    source: str,
-    dest: str,
-) -> int:
-    # Make a copy of the `graph` since we are modifying the `children` lists
-    scratch_graph = deepcopy(graph)
+    def __init__(self, edges: list[tuple[str, str]]):
+        self.ids = {}
+        for edge in edges:
+            for name in edge:
+                self.ids.setdefault(name, len(self.ids))
+        self.names = list(self.ids)
 
-    # Build a reverse index of the `scratch_graph`
-    reverse_index = defaultdict(list)
+        sources = np.array([self.ids[source] for source, _ in edges], dtype=np.int64)
+        dests = np.array([self.ids[dest] for _, dest in edges], dtype=np.int64)
 
-    # For all keys in the `scratch_graph` and the special "out" key
-    for key in chain(scratch_graph, ["out"]):
-        for candidate, children in scratch_graph.items():
-            if key in children:
-                reverse_index[key].append(candidate)
+        order = np.argsort(sources, kind="stable")
+        self.indices = dests[order].tolist()
+        self.indptr = np.concatenate(
+            [[0], np.cumsum(np.bincount(sources, minlength=len(self.names)))]
+        ).tolist()
 
-    # Make a dictionary for path resolutions. It begins fully unresolved with all of
-    # their children and initially the 0 paths to `dest`
-    path_resolutions = {}
-    for key, children in chain(scratch_graph.items(), [("out", [])]):
-        # The `dest` is fully resolved and has one initial path to itself
-        if key == dest:
-            path_resolutions[key] = (Counter(), 1)
-        else:
-            path_resolutions[key] = (Counter(children), 0)
+    def children(self, node: int) -> list[int]:
+        return self.indices[self.indptr[node] : self.indptr[node + 1]]
 
-    to_do = deque([dest])
+    def topological_order(self) -> list[int]:
+        """Kahn's algorithm. Every node comes before all of its children."""
+        in_degrees = [0] * len(self.names)
+        for child in self.indices:
+            in_degrees[child] += 1
 
-    while to_do:
-        # Resolve the `work` key in `not_resolved`, adding any fully resolved keys to
-        # the `resolved` dict and to the `to_do` processing deque
-        work = to_do.popleft()
+        order = [node for node, in_degree in enumerate(in_degrees) if in_degree == 0]
+        for node in order:
+            for child in self.children(node):
+                in_degrees[child] -= 1
+                if in_degrees[child] == 0:
+                    order.append(child)
 
-        for key, (children, path_counts) in path_resolutions.items():
-            # Skip if `children` is fully resolved already
-            if not children:
-                continue
+        # The graph has no loops, so every node gets ordered
+        assert len(order) == len(self.names)
+        return order
 
-            if work in children:
-                # Resolve `work` from the `children` list
-                n_occurences = children.pop(work)
-                path_counts += n_occurences * path_resolutions[work][1]
 
-                path_resolutions[key] = (children, path_counts)
+def read_input_data() -> Graph:
+    # Parse out the edges of the graph
+    edges = []
+    with IN_FILE.open("r") as f:
+        for node in f:
+            source, destinations = node.split(":", 1)
 
-            # This `key` became fully resolved if it has no more unresolved children
-            if not children:
-                to_do.append(key)
+            for match in re.finditer(r"([a-z]+)", destinations):
+                edges.append((source, match.group(1)))
 
-    # Now walk from `source` to `dest`, substituting any nodes
-    # until there is no more to substitute
-    while path_resolutions[source][0]:
-        children, path_counts = path_resolutions[source]
+    return Graph(edges)
 
-        new_children = Counter()
-        new_path_counts = path_counts
 
-        for child, n_occurences in children.items():
-            child_children, child_path_counts = path_resolutions[child]
+def path_count_matrix(graph: Graph, sources: list[str], dests: list[str]) -> list[list[int]]:
+    """The number of paths from every one of `sources` to every one of `dests`.
 
-            new_children += scale_counter(child_children, n_occurences)
-            new_path_counts += n_occurences * child_path_counts
+    Going through the nodes in reverse topological order, all children of a node have
+    their path counts to every `dest` by the time the node is reached, so they are
+    summed in one pass over the graph, in O((V + E) * len(dests))."""
+    dest_slots = {graph.ids[dest]: j for j, dest in enumerate(dests)}
+    path_counts = [[0] * len(dests) for _ in graph.names]
 
-        path_resolutions[source] = (new_children, new_path_counts)
+    for node in reversed(graph.topological_order()):
+        counts = path_counts[node]
+        for child in graph.children(node):
+            for j, count in enumerate(path_counts[child]):
+                counts[j] += count
 
-    return path_resolutions[source][1]
+        # A path to a `dest` stops there, but may also pass through on its way elsewhere
+        if (j := dest_slots.get(node)) is not None:
+            counts[j] = 1
 
+    return [path_counts[graph.ids[source]] for source in sources]
 
-def part1():
-    # Parse out the graph
-    graph = defaultdict(list)
-    with IN_FILE.open("r") as f:
-        for node in f:
-            source, destinations = node.split(":", 1)
 
-            for match in re.finditer(r"([a-z]+)", destinations):
-                graph[source].append(match.group(1))
+def count_paths(graph: Graph, *, source: str, dest: str) -> int:
+    """The number of paths from `source` to `dest`."""
+    return path_count_matrix(graph, [source], [dest])[0][0]
 
-    path_counts = reverse_fill_graph(graph, source="you", dest="out")
-    print(f"Part 1 Number of paths: {path_counts}")
 
+def count_waypoint_paths(
+    graph: Graph, *, source: str, dest: str, waypoints: list[str], ordered: bool = False
+) -> int:
+    """The number of paths from `source` to `dest` that visit all `waypoints`.
 
-def part2():
-    # Parse out the graph
-    graph = defaultdict(list)
-    with IN_FILE.open("r") as f:
-        for node in f:
-            source, destinations = node.split(":", 1)
+    The waypoints are visited in the given order if `ordered`, otherwise in any order.
+    Paths through a given order of waypoints are the product of the path counts between
+    consecutive stops, all read off of one `path_count_matrix`."""
+    stops = [source, *waypoints, dest]
+    matrix = path_count_matrix(graph, stops, stops)
 
-            for match in re.finditer(r"([a-z]+)", destinations):
-                graph[source].append(match.group(1))
+    path_counts = 0
+    for order in [waypoints] if ordered else permutations(waypoints):
+        chain = [source, *order, dest]
+        path_counts += math.prod(matrix[stops.index(a)][stops.index(b)] for a, b in pairwise(chain))
 
-    # Resolve the path counts with `dac`, `fft` and `out` as sources
-    svr_dac_path_counts = reverse_fill_graph(graph, source="svr", dest="dac")
-    dac_fft_path_counts = reverse_fill_graph(graph, source="dac", dest="fft")
-    fft_out_path_counts = reverse_fill_graph(graph, source="fft", dest="out")
+    return path_counts
 
-    svr_fft_path_counts = reverse_fill_graph(graph, source="svr", dest="fft")
-    fft_dac_path_counts = reverse_fill_graph(graph, source="fft", dest="dac")
-    dac_out_path_counts = reverse_fill_graph(graph, source="dac", dest="out")
 
-    # Compute the path counts: svr -> dac -> fft -> out equals the paths from
-    # (svr -> dac) * (dac -> fft) * (fft -> out)
-    path_counts_1 = svr_dac_path_counts * dac_fft_path_counts * fft_out_path_counts
+def part1():
+    graph = read_input_data()
+
+    path_counts = count_paths(graph, source="you", dest="out")
+    print(f"Part 1 Number of paths: {path_counts}")
+
+
+def part2():
+    graph = read_input_data()
 
-    # Compute the path counts: svr -> fft -> dac -> out equals the paths from
-    # (svr -> fft) * (fft -> dac) * (dac -> out)
-    path_counts_2 = svr_fft_path_counts * fft_dac_path_counts * dac_out_path_counts
+    # Both orders of visiting `dac` and `fft` are counted
+    path_counts = count_waypoint_paths(graph, source="svr", dest="out", waypoints=["dac", "fft"])
 
-    print(f"Part 2 Number of paths: {path_counts_1 + path_counts_2}")
+    print(f"Part 2 Number of paths: {path_counts}")
 
 
 if __name__ == "__main__":
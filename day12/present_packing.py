@@ -1,21 +1,71 @@
 from __future__ import annotations
 
+import hashlib
+import json
+import multiprocessing as mp
+import os
 import re
-import uuid
-from collections import defaultdict
-from collections.abc import Iterator
+import resource
+import sys
+import time
+from collections import Counter, defaultdict, namedtuple
+from collections.abc import Callable, Iterator
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from itertools import product
 from pathlib import Path
 
+import fire
+import numpy as np
 from ortools.sat.python import cp_model
 from tqdm import tqdm
 
 # IN_FILE = Path("./demo_input.txt")
 IN_FILE = Path("./full_input.txt")
 
+# Number of processes that check trees concurrently. The CP-SAT search threads
+# are split evenly among them so that the machine is not oversubscribed
+N_WORKERS = os.cpu_count() or 1
+
+# Per-tree solver time budget in seconds, `None` means no limit
+TIME_BUDGET = None
+
+# Solved trees are remembered across runs in this file
+CACHE_FILE = Path("./feasibility_cache.json")
+
+# The solver deciding the trees that the cheaper tiers leave open, see `SOLVER_BACKENDS`
+BACKEND = "cp_sat"
+
 PresentID = int
 PresentData = tuple[tuple[bool, ...], ...]
 
+# The decision of a tree along with the name of the tier in the pipeline that made it
+Decision = namedtuple("Decision", ["satisfiable", "tier"])
+
+# Decision tiers ordered from cheapest to most expensive
+TIER_AREA_BOUND = "area_bound"
+TIER_TILING_BOUND = "tiling_bound"
+TIER_CACHE = "cache"
+TIER_GREEDY = "greedy"
+TIER_CP_SAT = "cp_sat"
+TIER_BITBOARD = "bitboard"
+TIERS = (
+    TIER_AREA_BOUND,
+    TIER_TILING_BOUND,
+    TIER_CACHE,
+    TIER_GREEDY,
+    TIER_CP_SAT,
+    TIER_BITBOARD,
+)
+
+# Placeholder present ID for leaving a cell empty in the bitboard search
+EMPTY_CELL = -1
+
+# Most states the bitboard search remembers as failed, the oldest are forgotten first
+MAX_FAILED_STATES = 1 << 20
+
+# A tree up to rotation: (presents hash, short side, long side, present counts)
+TreeSignature = tuple[str, int, int, tuple[int, ...]]
+
 
 class Present:
     def __init__(
@@ -48,6 +98,14 @@ class Present:
         # Store all unique rotations. This removes any rotational symmetry in the shape
         self.data_rotations = {data, data_rot1, data_rot2, data_rot3}
 
+        # Every rotation as a bitmask with bit `row * 3 + col` set when that cell is covered,
+        # in `orientations_iter` order. Both the CP-SAT placements and the bitboards derive
+        # from these through `orientation_offsets`
+        self.orientation_bits = [
+            sum(1 << (row * 3 + col) for row, col in product(range(3), range(3)) if data[row][col])
+            for _, data in self.orientations_iter()
+        ]
+
     @staticmethod
     def _rotate_data(data: PresentData) -> PresentData:
         """Rotates the `data` clockwise."""
@@ -64,6 +122,37 @@ class Present:
     def orientations_iter(self) -> Iterator[tuple[int, PresentData]]:
         yield from enumerate(self.data_rotations)
 
+    def orientation_offsets(self, width: int) -> list[list[int]]:
+        """The cells covered by every orientation anchored at the top left corner of a grid
+        `width` cells wide, as ascending offsets `row * width + col`."""
+        return [
+            [(bit // 3) * width + bit % 3 for bit in range(9) if bits >> bit & 1]
+            for bits in self.orientation_bits
+        ]
+
+    def shape_key(self, *, mirrored: bool = False) -> str:
+        """A string identifying the shape regardless of its rotation, optionally mirrored."""
+        rotations = self.data_rotations
+        if mirrored:
+            rotations = {tuple(row[::-1] for row in data) for data in rotations}
+
+        return "|".join(
+            sorted("".join("#" if v else "." for row in data for v in row) for data in rotations)
+        )
+
+
+def hash_presents(presents: list[Present]) -> str:
+    """Content hash of the `presents` in ID order.
+
+    Mirroring every present at once mirrors every packing along with it, so
+    both the problem and its mirror image hash the same."""
+    digests = []
+    for mirrored in (False, True):
+        key = "\n".join(present.shape_key(mirrored=mirrored) for present in presents)
+        digests.append(hashlib.sha256(key.encode()).hexdigest())
+
+    return min(digests)
+
 
 class ChristmasTree:
     def __init__(
@@ -80,109 +169,555 @@ class ChristmasTree:
         self.present_counts = dict(enumerate(present_counts))
         self.presents = presents
 
-    def is_satisfiable(self) -> bool:
-        total_present_area = sum(
+        self.n_presents = sum(present_counts)
+        self.total_present_area = sum(
             p_count * self.presents[p_id].size for p_id, p_count in self.present_counts.items()
         )
 
-        # Build the CP-SAT problem
-        model = cp_model.CpModel()
+    def decide_by_bounds(self) -> Decision | None:
+        """Decide the trees that are trivial by counting alone, otherwise `None`."""
+        # The presents cover more cells than there are under the tree
+        if self.total_present_area > self.width * self.height:
+            return Decision(False, TIER_AREA_BOUND)
+
+        # Every present fits in its own 3x3 block, no packing cleverness required
+        if (self.width // 3) * (self.height // 3) >= self.n_presents:
+            return Decision(True, TIER_TILING_BOUND)
+
+        return None
+
+    def signature(self) -> TreeSignature:
+        """Rotating the whole tree by 90 degrees swaps its width and height but keeps it
+        satisfiable, so the dimensions are normalized to (short side, long side)."""
+        short_side, long_side = sorted((self.width, self.height))
+        counts = tuple(self.present_counts[p_id] for p_id in sorted(self.present_counts))
+
+        return hash_presents(self.presents), short_side, long_side, counts
 
-        # Represents the spaces that are occupied by a present anchored at all possible positions
-        sat_vars_by_present = defaultdict(
-            lambda: defaultdict(lambda: model.NewBoolVar(f"p_{uuid.uuid4().hex}"))
+    def decide(
+        self,
+        *,
+        backend: str = BACKEND,
+        n_search_workers: int = 0,
+        time_budget: float | None = None,
+    ) -> Decision:
+        """Run the tiers from cheapest to most expensive until one decides the tree."""
+        if (decision := self.decide_by_bounds()) is not None:
+            return decision
+
+        # The greedy packer can only prove a tree satisfiable
+        if self._greedy_pack():
+            return Decision(True, TIER_GREEDY)
+
+        satisfiable = SOLVER_BACKENDS[backend](
+            self, n_search_workers=n_search_workers, time_budget=time_budget
         )
+        return Decision(satisfiable, backend)
 
-        sat_vars_grid_occupancy = [
-            [model.NewBoolVar(f"occ_{x}_{y}") for x in range(self.width)]
-            for y in range(self.height)
+    def is_satisfiable(
+        self,
+        *,
+        backend: str = BACKEND,
+        n_search_workers: int = 0,
+        time_budget: float | None = None,
+    ) -> bool | None:
+        """Check if all of the presents can be packed under this tree.
+
+        Returns `None` if the solver ran out of its `time_budget` before deciding.
+        A `n_search_workers` of 0 lets CP-SAT pick its own number of search threads."""
+        return self.decide(
+            backend=backend, n_search_workers=n_search_workers, time_budget=time_budget
+        ).satisfiable
+
+    def _orientation_bitboards(self, p_id: PresentID) -> list[int]:
+        """The bitboard of every orientation of a present anchored at the top left corner.
+
+        Bit `row * self.width + col` is set when that cell is covered."""
+        return [
+            sum(1 << offset for offset in offsets)
+            for offsets in self.presents[p_id].orientation_offsets(self.width)
         ]
 
-        # Variables used to require the exact amount of present counts
-        sat_vars_presents = [[] for _ in self.present_counts]
+    def _greedy_pack(self) -> bool:
+        """First-fit packing of the largest presents first, scanning anchors row by row.
+
+        The grid is a bitboard with bit `row * self.width + col` set when that cell is occupied."""
+        occupied = 0
+        anchors = list(product(range(self.height - 2), range(self.width - 2)))
 
-        # Variables used to require grid elements to have at most one occupant
-        sat_vars_grid = [[[] for _ in range(self.width)] for _ in range(self.height)]
+        by_size = sorted(self.present_counts.items(), key=lambda p: -self.presents[p[0]].size)
+        for p_id, p_count in by_size:
+            if not p_count:
+                continue
 
+            masks = self._orientation_bitboards(p_id)
+
+            # Anchors before the last placement of this present are known not to fit
+            # since the grid only fills up. So resume the scan from there
+            anchor_idx = 0
+            for _ in range(p_count):
+                while anchor_idx < len(anchors):
+                    row, col = anchors[anchor_idx]
+                    shift = row * self.width + col
+
+                    placed = next((m << shift for m in masks if not occupied & (m << shift)), 0)
+                    if placed:
+                        occupied |= placed
+                        break
+
+                    anchor_idx += 1
+                else:
+                    # Ran out of anchors for this present
+                    return False
+
+        return True
+
+    def placement_incidence(self) -> tuple[dict[PresentID, range], np.ndarray, np.ndarray]:
+        """Enumerate every (present, anchor, orientation) placement that lies inside the grid.
+
+        Cells are indexed as `row * self.width + col`. Returns the contiguous span of placement
+        indices belonging to each present, and the cell to placement incidence in CSR form:
+        the placements covering cell `c` are `indices[indptr[c] : indptr[c + 1]]`."""
+        n_cells = self.width * self.height
+
+        # Stop 2 units from the right and bottom edges of the grid to prevent
+        # the shape from extending beyond the grid's bounds
+        anchors = (
+            np.arange(self.height - 2)[:, None] * self.width + np.arange(self.width - 2)[None, :]
+        ).ravel()
+
+        present_spans = {}
+        cells_blocks = []
+        owners_blocks = []
+        n_placements = 0
         for p_id, p_count in self.present_counts.items():
             # Skip if there is no `p_count`
             if not p_count:
                 continue
 
-            present = self.presents[p_id]
-
-            # For every pivot position and every rotation. Stop 2 units from the right
-            # and bottom edges of the grid to  prevent the shape from extending beyond
-            # the grid's bounds
-            for row, col in product(range(self.height - 2), range(self.width - 2)):
-                for rotation, data in present.orientations_iter():
-                    key = (row, col, rotation)
-                    var = sat_vars_by_present[p_id][key]
-
-                    # Look where the current configuration is non-empty and add the `var`
-                    # to the respective grid square's expression
-                    for col_diff, row_diff in product(range(3), range(3)):
-                        if data[row_diff][col_diff]:
-                            # Some sanity checks
-                            assert row + row_diff < self.height
-                            assert col + col_diff < self.width
-                            sat_vars_grid[row + row_diff][col + col_diff].append(var)
-
-            # When done processing this present and its rotations, add of this present's
-            # variables in to one large present expression
-            for var in sat_vars_by_present[p_id].values():
-                sat_vars_presents[p_id].append(var)
-
-            # The present variables have to sum up to exactly `p_count`, meaning that
-            # for this present exactly `p_count` of it must be selected
-            model.Add(sum(sat_vars_presents[p_id]) == p_count)
+            p_start = n_placements
+            for offsets in self.presents[p_id].orientation_offsets(self.width):
+                offsets = np.array(offsets)
+
+                # One row of covered cells per anchor, and the placement owning each cell
+                cells_blocks.append((anchors[:, None] + offsets[None, :]).ravel())
+                owners_blocks.append(
+                    np.repeat(np.arange(n_placements, n_placements + len(anchors)), len(offsets))
+                )
+                n_placements += len(anchors)
+
+            present_spans[p_id] = range(p_start, n_placements)
+
+        cells = np.concatenate(cells_blocks) if cells_blocks else np.zeros(0, dtype=np.int64)
+        owners = np.concatenate(owners_blocks) if owners_blocks else np.zeros(0, dtype=np.int64)
+
+        # Group the placements by the cells they cover
+        indices = owners[np.argsort(cells, kind="stable")]
+        indptr = np.zeros(n_cells + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cells, minlength=n_cells), out=indptr[1:])
+
+        return present_spans, indptr, indices
+
+    def build_cp_sat_model(self) -> cp_model.CpModel:
+        """Build the packing model over one boolean variable per placement.
+
+        The larger trees have hundreds of thousands of placements, so the variables and
+        constraints are written straight in to the model proto, each constraint with a
+        single call, rather than creating a Python object for every variable."""
+        model = cp_model.CpModel()
+        proto = model.proto
+        present_spans, indptr, indices = self.placement_incidence()
+
+        # One variable per placement, selected if the present is placed there, followed by
+        # the occupancy of each grid cell, indexed as `row * self.width + col`
+        n_placements = sum(len(span) for span in present_spans.values())
+        n_cells = self.width * self.height
+        proto.merge_text_format("variables { domain: [0, 1] } " * (n_placements + n_cells))
+        occupancy_vars = np.arange(n_placements, n_placements + n_cells)
+
+        def add_linear(sat_vars: np.ndarray, coeffs: np.ndarray, lower: int, upper: int):
+            linear = proto.constraints.add().linear
+            linear.vars.extend(sat_vars)
+            linear.coeffs.extend(coeffs)
+            linear.domain.extend([lower, upper])
+
+        # The present variables have to sum up to exactly `p_count`, meaning that
+        # for this present exactly `p_count` of it must be selected
+        for p_id, span in present_spans.items():
+            p_count = self.present_counts[p_id]
+            add_linear(
+                np.arange(span.start, span.stop),
+                np.ones(len(span), dtype=np.int64),
+                p_count,
+                p_count,
+            )
 
         # Go through the grid and build the occupancy dependency on all of the present variables
         # This enforces no overlaps since occupancy is a boolean `{0, 1}`. And conversely
-        # the occupancy is `True` if there is a var set for `row` and `col`
-        for row, col in product(range(self.height), range(self.width)):
-            model.Add(sum(sat_vars_grid[row][col]) == sat_vars_grid_occupancy[row][col])
+        # the occupancy is `True` if there is a var set for the cell
+        for cell, cell_placements in enumerate(np.split(indices, indptr[1:-1])):
+            coeffs = np.ones(len(cell_placements) + 1, dtype=np.int64)
+            coeffs[-1] = -1
+            add_linear(np.append(cell_placements, occupancy_vars[cell]), coeffs, 0, 0)
 
         # The occupied cells must equal the `total_present_area` to ensure no overlapping
-        model.Add(
-            sum(
-                sat_vars_grid_occupancy[row][col]
-                for row, col in product(range(self.height), range(self.width))
-            )
-            == total_present_area
+        add_linear(
+            occupancy_vars,
+            np.ones(n_cells, dtype=np.int64),
+            self.total_present_area,
+            self.total_present_area,
         )
 
-        # Additionally kill any translational symmetry by requiring that the solved
-        # shape touch both the top-most row and leftmost column
-        model.AddAtLeastOne(sat_vars_grid_occupancy[0])
-        model.AddAtLeastOne([sat_vars_grid_occupancy[row][0] for row in range(self.height)])
-
-        # Add weak constraints that narrow down reflective symmetry by requiring the first row
-        # to be left-heavy and the first column to be top-heavy.
-        model.Add(
-            sum(sat_vars_grid_occupancy[0][col] for col in range(self.width // 2))
-            >= sum(
-                sat_vars_grid_occupancy[0][col]
-                for col in range(self.width - 1, self.width // 2, -1)
-            )
-        )
+        first_row = occupancy_vars[: self.width]
+        first_col = occupancy_vars[:: self.width]
 
-        model.Add(
-            sum(sat_vars_grid_occupancy[row][0] for row in range(self.height // 2))
-            >= sum(
-                sat_vars_grid_occupancy[row][0]
-                for row in range(self.height - 1, self.height // 2, -1)
-            )
-        )
+        for line in (first_row, first_col):
+            # Additionally kill any translational symmetry by requiring that the solved
+            # shape touch both the top-most row and leftmost column
+            proto.constraints.add().bool_or.literals.extend(line)
+
+            # Add weak constraints that narrow down reflective symmetry by requiring the first
+            # row to be left-heavy and the first column to be top-heavy
+            half = len(line) // 2
+            coeffs = np.zeros(len(line), dtype=np.int64)
+            coeffs[:half] = 1
+            coeffs[half + 1 :] = -1
+            add_linear(line, coeffs, 0, cp_model.INT_MAX)
+
+        return model
+
+    def _solve_cp_sat(
+        self,
+        *,
+        n_search_workers: int = 0,
+        time_budget: float | None = None,
+    ) -> bool | None:
+        model = self.build_cp_sat_model()
 
         # Feasibility only (no objective)
         solver = cp_model.CpSolver()
+        solver.parameters.num_workers = n_search_workers
+        if time_budget is not None:
+            solver.parameters.max_time_in_seconds = time_budget
+
         status = solver.Solve(model)
 
+        if status == cp_model.UNKNOWN:
+            return None
+
         return status in (cp_model.FEASIBLE, cp_model.OPTIMAL)
 
+    def _solve_bitboard(
+        self,
+        *,
+        n_search_workers: int = 0,
+        time_budget: float | None = None,
+    ) -> bool | None:
+        """Backtracking exact cover that decides the first free cell next, either placing a
+        present there or leaving it empty at the cost of one unit of slack.
+
+        Copies of a present are interchangeable so only their counts are tracked. The search
+        is single threaded, so the `n_search_workers` are unused."""
+        n_cells = self.width * self.height
+
+        # The number of cells that can still be left empty
+        slack = n_cells - self.total_present_area
+        if slack < 0:
+            return False
+
+        n_left = self.n_presents
+        if not n_left:
+            return True
+
+        remaining = dict(self.present_counts)
+
+        # The anchors where a present stays inside the grid, as a bitboard
+        anchors = sum(
+            1 << (row * self.width + col)
+            for row, col in product(range(self.height - 2), range(self.width - 2))
+        )
+
+        # For every cell, the placements whose first covered cell (in row-major order) it is
+        placements_at = [[] for _ in range(n_cells)]
+        orientation_offsets = {}
+        for p_id, p_count in self.present_counts.items():
+            if not p_count:
+                continue
+
+            orientation_offsets[p_id] = self.presents[p_id].orientation_offsets(self.width)
+            for mask in self._orientation_bitboards(p_id):
+                first = (mask & -mask).bit_length() - 1
+                for row, col in product(range(self.height - 2), range(self.width - 2)):
+                    shift = row * self.width + col
+                    placements_at[first + shift].append((p_id, mask << shift))
+
+        # Leaving the cell empty is tried last
+        for cell, placements in enumerate(placements_at):
+            placements.append((EMPTY_CELL, 1 << cell))
+
+        def too_many_dead_cells(free: int) -> bool:
+            """Whether more of the `free` cells than there is slack left have no remaining
+            present fit over them, meaning that they can only be left empty."""
+            dead = free
+            for p_id, all_offsets in orientation_offsets.items():
+                if not remaining[p_id]:
+                    continue
+
+                # All of the anchors of an orientation at once, shifting the free cells
+                # under every one of its covered cells back on to the anchor
+                for offsets in all_offsets:
+                    fits = anchors
+                    for offset in offsets:
+                        fits &= free >> offset
+                    for offset in offsets:
+                        dead &= ~(fits << offset)
+
+                # The other presents can only bring the count down further
+                if dead.bit_count() <= slack:
+                    return False
+
+            return True
+
+        deadline = None if time_budget is None else time.perf_counter() + time_budget
+        all_cells = (1 << n_cells) - 1
+        occupied = 0
+
+        # Every cell before the first free one is settled, so the state at a frame is
+        # the occupancy from its cell onward along with the presents left to place
+        def state_key(cell: int) -> tuple[int, int, tuple[int, ...]]:
+            return cell, occupied >> cell, tuple(remaining.values())
+
+        # Used as an insertion ordered set, so that the oldest state is evicted first
+        failed_states = {}
+
+        def add_failed_state(key: tuple[int, int, tuple[int, ...]]):
+            failed_states[key] = None
+            if len(failed_states) > MAX_FAILED_STATES:
+                del failed_states[next(iter(failed_states))]
+
+        if too_many_dead_cells(all_cells):
+            return False
+
+        # Each frame is `[cell, next option index, applied option, state key]`
+        frames = [[0, 0, None, state_key(0)]]
+        n_steps = 0
+        while frames:
+            frame = frames[-1]
+            cell, option_idx, applied, _ = frame
+
+            # Undo the option this frame applied before trying the next one
+            if applied is not None:
+                p_id, mask = applied
+                occupied ^= mask
+                if p_id == EMPTY_CELL:
+                    slack += 1
+                else:
+                    remaining[p_id] += 1
+                    n_left += 1
+
+            options = placements_at[cell]
+            while option_idx < len(options):
+                p_id, mask = options[option_idx]
+                option_idx += 1
+
+                if p_id == EMPTY_CELL:
+                    if slack:
+                        break
+                elif remaining[p_id] and not occupied & mask:
+                    break
+            else:
+                # Exhausted every option for this cell, backtrack
+                add_failed_state(frames.pop()[3])
+                continue
+
+            # Apply the option
+            occupied |= mask
+            if p_id == EMPTY_CELL:
+                slack -= 1
+            else:
+                remaining[p_id] -= 1
+                n_left -= 1
+            frame[1] = option_idx
+            frame[2] = (p_id, mask)
+
+            if not n_left:
+                return True
+
+            # Give up once the time budget runs out, checking the clock only occasionally
+            n_steps += 1
+            if deadline is not None and not n_steps % 4096 and time.perf_counter() > deadline:
+                return None
+
+            # Descend to the next free cell. There always is one since the free cells
+            # are exactly the remaining present area plus the remaining slack
+            free = all_cells & ~occupied
+            next_cell = (free & -free).bit_length() - 1
+            if (key := state_key(next_cell)) in failed_states:
+                continue
+
+            if too_many_dead_cells(free):
+                add_failed_state(key)
+                continue
+
+            frames.append([next_cell, 0, None, key])
+
+        return False
+
+
+# Solvers that decide the trees left open by the cheaper tiers, selectable by name.
+# Each is called as `solver(tree, *, n_search_workers, time_budget)` and returns
+# `None` if it ran out of its time budget
+SOLVER_BACKENDS: dict[str, Callable[..., bool | None]] = {
+    TIER_CP_SAT: ChristmasTree._solve_cp_sat,
+    TIER_BITBOARD: ChristmasTree._solve_bitboard,
+}
+
+
+class FeasibilityCache:
+    """Decided trees stored on disk, keyed by the hash of their presents.
+
+    Lookups also use monotonicity: a tree is satisfiable if a tree no bigger with
+    at least as many of every present was, and unsatisfiable if a tree no smaller
+    with at most as many of every present was not."""
+
+    def __init__(self, path: Path = CACHE_FILE):
+        self.path = path
+
+        # Maps presents hash -> {"satisfiable": [...], "unsatisfiable": [...]} where
+        # each entry is `[short_side, long_side, present_counts]`
+        self.entries = json.loads(path.read_text()) if path.exists() else {}
+
+    def lookup(self, tree: ChristmasTree) -> bool | None:
+        presents_hash, short_side, long_side, counts = tree.signature()
+        entries = self.entries.get(presents_hash)
+        if entries is None:
+            return None
+
+        for e_short, e_long, e_counts in entries["satisfiable"]:
+            if (
+                short_side >= e_short
+                and long_side >= e_long
+                and all(c <= e_c for c, e_c in zip(counts, e_counts, strict=True))
+            ):
+                return True
+
+        for e_short, e_long, e_counts in entries["unsatisfiable"]:
+            if (
+                short_side <= e_short
+                and long_side <= e_long
+                and all(c >= e_c for c, e_c in zip(counts, e_counts, strict=True))
+            ):
+                return False
 
-def part1():
+        return None
+
+    def add(self, tree: ChristmasTree, satisfiable: bool):
+        presents_hash, short_side, long_side, counts = tree.signature()
+        entries = self.entries.setdefault(presents_hash, {"satisfiable": [], "unsatisfiable": []})
+        entries["satisfiable" if satisfiable else "unsatisfiable"].append(
+            [short_side, long_side, list(counts)]
+        )
+
+    def save(self):
+        self.path.write_text(json.dumps(self.entries))
+
+
+def _check_tree(
+    tree_idx: int,
+    tree: ChristmasTree,
+    backend: str,
+    n_search_workers: int,
+    time_budget: float | None,
+) -> tuple[int, Decision]:
+    """Worker entry point. Returns the `tree_idx` so results can be streamed out of order."""
+    return tree_idx, tree.decide(
+        backend=backend, n_search_workers=n_search_workers, time_budget=time_budget
+    )
+
+
+def check_trees(
+    trees: list[ChristmasTree],
+    *,
+    backend: str = BACKEND,
+    n_workers: int = N_WORKERS,
+    time_budget: float | None = TIME_BUDGET,
+    cache: FeasibilityCache | None = None,
+) -> Iterator[tuple[int, Decision]]:
+    """Check every tree, yielding `(tree_idx, decision)` as soon as each one finishes."""
+    if backend not in SOLVER_BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}, expected one of {list(SOLVER_BACKENDS)}")
+
+    def cached_decision(tree: ChristmasTree) -> Decision | None:
+        if cache is None or (satisfiable := cache.lookup(tree)) is None:
+            return None
+        return Decision(satisfiable, TIER_CACHE)
+
+    # Settle the trivial and already known trees right away and only hand the rest to
+    # the workers. Trees sharing a signature are grouped so that each is solved once
+    to_solve = defaultdict(list)
+    for tree_idx, tree in enumerate(trees):
+        if (decision := tree.decide_by_bounds() or cached_decision(tree)) is not None:
+            yield tree_idx, decision
+        else:
+            to_solve[tree.signature()].append(tree_idx)
+
+    if not to_solve:
+        return
+
+    def fan_out(tree_idxs: list[int], decision: Decision) -> Iterator[tuple[int, Decision]]:
+        """Yield the `decision` for every tree in a group, recording it in the `cache`."""
+        if cache is not None and decision.satisfiable is not None:
+            cache.add(trees[tree_idxs[0]], decision.satisfiable)
+
+        yield tree_idxs[0], decision
+
+        # The rest of the group is answered by the first tree's result
+        for tree_idx in tree_idxs[1:]:
+            yield tree_idx, decision._replace(tier=TIER_CACHE)
+
+    n_workers = max(1, min(n_workers, len(to_solve)))
+
+    # Split the CPU cores among the processes. When running in a single process,
+    # let CP-SAT use all of them like before
+    n_search_workers = 0 if n_workers == 1 else max(1, (os.cpu_count() or 1) // n_workers)
+
+    try:
+        if n_workers == 1:
+            for tree_idxs in to_solve.values():
+                tree = trees[tree_idxs[0]]
+
+                # Earlier solves in this run may already imply this tree's result
+                if (decision := cached_decision(tree)) is None:
+                    _, decision = _check_tree(
+                        tree_idxs[0], tree, backend, n_search_workers, time_budget
+                    )
+
+                yield from fan_out(tree_idxs, decision)
+            return
+
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = {
+                executor.submit(
+                    _check_tree,
+                    tree_idxs[0],
+                    trees[tree_idxs[0]],
+                    backend,
+                    n_search_workers,
+                    time_budget,
+                ): tree_idxs
+                for tree_idxs in to_solve.values()
+            }
+
+            for future in as_completed(futures):
+                _, decision = future.result()
+                yield from fan_out(futures[future], decision)
+    finally:
+        if cache is not None:
+            cache.save()
+
+
+def read_input_data() -> list[ChristmasTree]:
+    """Read the presents and the Christmas trees that they must be packed under."""
     file_contents = IN_FILE.read_text()
 
     # Matches:
@@ -207,12 +742,116 @@ def part1():
 
         trees.append(ChristmasTree(width, height, present_counts, presents))
 
+    return trees
+
+
+def _build_models(trees: list[ChristmasTree]) -> tuple[float, int, int]:
+    """Build every model, returning the elapsed seconds and this process' peak RSS in KB
+    from before and after building."""
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start = time.perf_counter()
+    for tree in trees:
+        tree.build_cp_sat_model()
+    elapsed = time.perf_counter() - start
+
+    return elapsed, rss_before, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def benchmark_model_build():
+    """Build the CP-SAT model of every tree without solving, reporting time and peak memory.
+
+    The models are built in a process forked from a fresh forkserver, so the peak RSS is
+    not polluted by the parent. The peak RSS carries over through both fork and exec, so
+    a process forked or spawned from the parent would already count the parent's.
+    For reference, `REMARKS.md` recorded a peak of 1403824 KB before the placement arrays."""
+    trees = read_input_data()
+
+    with ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context("forkserver")) as executor:
+        elapsed, rss_before, peak_rss = executor.submit(_build_models, trees).result()
+
+    print(
+        f"Built {len(trees)} models in {elapsed:.2f} s ({elapsed / len(trees) * 1000:.1f} ms each)"
+    )
+    print(f"Peak RSS while building: {peak_rss} KB ({peak_rss - rss_before} KB from building)")
+
+
+def _time_backend(
+    trees: list[ChristmasTree], backend: str, time_budget: float | None
+) -> tuple[float, list[bool | None]]:
+    """Solve every tree with the `backend` alone, skipping the cheaper tiers."""
+    solver = SOLVER_BACKENDS[backend]
+
+    start = time.perf_counter()
+    results = [solver(tree, n_search_workers=0, time_budget=time_budget) for tree in tqdm(trees)]
+    return time.perf_counter() - start, results
+
+
+def benchmark_backends(time_budget: float | None = 10.0):
+    """Compare the solver backends on every tree of the input, without the cheaper tiers."""
+    trees = read_input_data()
+
+    all_results = {}
+    for backend in SOLVER_BACKENDS:
+        elapsed, results = _time_backend(trees, backend, time_budget)
+        all_results[backend] = results
+
+        n_undecided = sum(r is None for r in results)
+        print(
+            f"{backend}: {elapsed:.2f} s total, {elapsed / len(trees) * 1e6:.0f} us per tree, "
+            f"{n_undecided} undecided within the time budget"
+        )
+
+    # Both backends must agree wherever both of them decided
+    n_disagree = sum(
+        len({r for r in tree_results if r is not None}) > 1
+        for tree_results in zip(*all_results.values(), strict=True)
+    )
+    print(f"Trees where the backends disagree: {n_disagree}")
+
+
+def part1(
+    backend: str = BACKEND,
+    n_workers: int = N_WORKERS,
+    time_budget: float | None = TIME_BUDGET,
+    use_cache: bool = True,
+):
+    trees = read_input_data()
+    cache = FeasibilityCache() if use_cache else None
+
     n_satisfied = 0
-    for tree in tqdm(trees, desc="Working"):
-        n_satisfied += int(tree.is_satisfiable())
+    n_undecided = 0
+    tier_counts = Counter()
+    results = check_trees(
+        trees, backend=backend, n_workers=n_workers, time_budget=time_budget, cache=cache
+    )
+    for _, (satisfiable, tier) in tqdm(results, total=len(trees), desc="Working"):
+        if satisfiable is None:
+            n_undecided += 1
+        else:
+            tier_counts[tier] += 1
+            n_satisfied += int(satisfiable)
+
+    for tier in TIERS:
+        print(f"Part 1 trees resolved by {tier}: {tier_counts[tier]}")
+
+    # Trees that ran out of their `time_budget` are not counted as satisfied
+    if n_undecided:
+        print(f"Part 1 trees undecided within time budget: {n_undecided}")
 
     print(f"Part 1 Christmas trees satisfied: {n_satisfied}")
 
 
 if __name__ == "__main__":
-    part1()
+    commands = {
+        "part1": part1,
+        "benchmark_model_build": benchmark_model_build,
+        "benchmark_backends": benchmark_backends,
+    }
+
+    # Dispatch to a named command, e.g. `python present_packing.py benchmark_model_build`,
+    # otherwise run `part1` with any flags, e.g. `python present_packing.py --n_workers=4`
+    if len(sys.argv) > 1 and sys.argv[1] in commands:
+        fire.Fire(commands)
+    else:
+        fire.Fire(part1)
@@ -1,4 +1,3 @@
-import math
 import re
 from pathlib import Path
 
@@ -6,17 +5,52 @@ from pathlib import Path
 IN_FILE = Path("./full_input.txt")
 
 
-def is_invalid_id_part1(num: int) -> bool:
-    n_digits = math.ceil(math.log10(num))
-    # ID must be even number of digits
-    if n_digits % 2:
-        return False
+def periodic_id_sum(range_start: int, range_end: int, n_digits: int, block_size: int) -> int:
+    """Sum the `n_digits` long IDs in the range that repeat a `block_size` digit block.
 
-    lower_half_mask = 10 ** (n_digits // 2)
-    lower_half = num % lower_half_mask
-    upper_half = (num - lower_half) // lower_half_mask
+    Such an ID is `block * repunit`, where the `repunit` is `1` followed by zeros repeated
+    every `block_size` digits, e.g. `10101` for 5 digits in blocks of 1. The blocks in the
+    range are consecutive, so their sum is an arithmetic series."""
+    repunit = (10**n_digits - 1) // (10**block_size - 1)
 
-    return lower_half == upper_half
+    # The blocks need exactly `block_size` digits, so no leading zeros
+    block_lo = max(10 ** (block_size - 1), -(-range_start // repunit))
+    block_hi = min(10**block_size - 1, range_end // repunit)
+    if block_lo > block_hi:
+        return 0
+
+    return repunit * (block_lo + block_hi) * (block_hi - block_lo + 1) // 2
+
+
+def invalid_id_sum(range_start: int, range_end: int, *, any_repeats: bool) -> int:
+    """Sum the IDs in the range made of a digit block repeated twice, or if `any_repeats`,
+    repeated at least twice.
+
+    An ID repeating a block of `d` digits also repeats every block made of whole copies
+    of it, so summing over each block size would count it several times. Instead only
+    count every ID under its shortest block: the sum over the IDs whose shortest block
+    is `d` digits is the sum over all IDs repeating `d` digits, minus those whose
+    shortest block divides `d`."""
+    invalid_sum = 0
+    for n_digits in range(len(str(range_start)), len(str(range_end)) + 1):
+        if not any_repeats:
+            if n_digits % 2 == 0:
+                invalid_sum += periodic_id_sum(range_start, range_end, n_digits, n_digits // 2)
+            continue
+
+        # Sums of the IDs by their shortest block size, for all block sizes dividing `n_digits`
+        shortest_block_sums = {}
+        for block_size in range(1, n_digits):
+            if n_digits % block_size:
+                continue
+
+            shortest_block_sums[block_size] = periodic_id_sum(
+                range_start, range_end, n_digits, block_size
+            ) - sum(s for size, s in shortest_block_sums.items() if block_size % size == 0)
+
+        invalid_sum += sum(shortest_block_sums.values())
+
+    return invalid_sum
 
 
 def part1():
@@ -26,32 +60,11 @@ def part1():
         range_start = int(match.group(1))
         range_end = int(match.group(2))
 
-        for i in range(range_start, range_end + 1):
-            if is_invalid_id_part1(i):
-                invalid_sum += i
+        invalid_sum += invalid_id_sum(range_start, range_end, any_repeats=False)
 
     print(f"Part1 Invalid sum is: {invalid_sum}")
 
 
-def is_invalid_id_part2(num: int) -> bool:
-    num_str = str(num)
-    num_len = len(num_str)
-
-    for prefix_sz in range(1, (num_len // 2) + 1):
-        # Check if `prefix_sz` divides `num_len`, otherwise skip
-        if num_len % prefix_sz:
-            continue
-        n_prefixes = num_len // prefix_sz
-        prefix = num_str[:prefix_sz]
-
-        # Found an invalid match!
-        if prefix * n_prefixes == num_str:
-            return True
-
-    # No invalid match found
-    return False
-
-
 def part2():
     pattern = re.compile(r"(\d+)-(\d+)")
     invalid_sum = 0
@@ -59,9 +72,7 @@ def part2():
         range_start = int(match.group(1))
         range_end = int(match.group(2))
 
-        for i in range(range_start, range_end + 1):
-            if is_invalid_id_part2(i):
-                invalid_sum += i
+        invalid_sum += invalid_id_sum(range_start, range_end, any_repeats=True)
 
     print(f"Part2 Invalid sum is: {invalid_sum}")
 
@@ -1,12 +1,50 @@
+import random
 from collections import defaultdict
 from collections.abc import Iterable
 from pathlib import Path
 
+import numpy as np
+
 # IN_FILE = Path("./demo_input.txt")
 IN_FILE = Path("./full_input.txt")
 
 
 def compute_max_joltage(battery_bank: Iterable[int], n_active: int) -> int:
+    """The largest number made of `n_active` of the batteries, keeping their order.
+
+    The batteries are pushed on a stack, first popping every smaller battery on top of
+    it while there are batteries left to spare. A larger battery further left always
+    makes a larger number, so each battery is pushed and popped at most once."""
+    battery_bank = list(battery_bank)
+    n_spare = len(battery_bank) - n_active
+    assert n_spare >= 0
+
+    selected_values = []
+    for b in battery_bank:
+        while n_spare and selected_values and selected_values[-1] < b:
+            selected_values.pop()
+            n_spare -= 1
+        selected_values.append(b)
+
+    # Any batteries left to spare are the smallest trailing ones
+    return digits_to_int(selected_values[:n_active])
+
+
+def digits_to_int(digits: list[int]) -> int:
+    """Join the `digits` in to a number, splitting them in halves so that building very
+    long numbers does not take quadratic time."""
+    if len(digits) <= 18:
+        ret = 0
+        for digit in digits:
+            ret = ret * 10 + digit
+        return ret
+
+    mid = len(digits) // 2
+    return digits_to_int(digits[:mid]) * 10 ** (len(digits) - mid) + digits_to_int(digits[mid:])
+
+
+def compute_max_joltage_backtracking(battery_bank: Iterable[int], n_active: int) -> int:
+    """Reference for `compute_max_joltage` that searches the digits from 9 down to 0."""
     b_indices = defaultdict(list)
     for i, b in enumerate(battery_bank):
         b_indices[b].append(i)
@@ -60,26 +98,95 @@ def compute_max_joltage(battery_bank: Iterable[int], n_active: int) -> int:
     return ret_joltage
 
 
-def part1():
-    sum_joltage = 0
-    for battery_bank in IN_FILE.open("r"):
-        # Strip any trailing newlines
-        battery_bank = battery_bank.rstrip("\n")
-        sum_joltage += compute_max_joltage(map(int, battery_bank), 2)
+def read_battery_banks() -> np.ndarray:
+    """Memory-map the input as a 2D matrix of digits, one row per battery bank.
+
+    All battery banks are the same length, so every line including its newline is one
+    row of the file's bytes."""
+    buf = np.memmap(IN_FILE, dtype=np.uint8, mode="r")
+
+    # Drop any trailing blank lines, keeping the newline of the last battery bank
+    end = len(buf)
+    while end and buf[end - 1] == ord("\n"):
+        end -= 1
+    lines = buf[: end + 1] if end < len(buf) else np.append(buf, np.uint8(ord("\n")))
+
+    width = int(np.argmax(lines == ord("\n")))
+    assert len(lines) % (width + 1) == 0, "Battery banks must all be the same length"
+    lines = lines.reshape(-1, width + 1)
+
+    # Every line is all digits, ending in exactly one newline
+    assert (lines[:, -1] == ord("\n")).all()
+    rows = lines[:, :-1]
+    assert ((rows >= ord("0")) & (rows <= ord("9"))).all()
+
+    # Signed, so that masked out batteries can be marked with -1
+    return (rows - ord("0")).astype(np.int8)
+
+
+def compute_max_joltages(battery_banks: np.ndarray, n_active: int) -> np.ndarray:
+    """`compute_max_joltage` for every battery bank at once.
+
+    The `i`-th active battery is the leftmost largest one after the previously picked
+    battery that still leaves room for the remaining `n_active - i - 1`. That window is
+    searched with one `np.argmax` over every bank, masking the batteries outside of it."""
+    # The joltages must fit in an int64
+    assert n_active <= 18
+
+    n_banks, width = battery_banks.shape
+    columns = np.arange(width)
+    banks = np.arange(n_banks)
+
+    joltages = np.zeros(n_banks, dtype=np.int64)
+    window_starts = np.zeros(n_banks, dtype=np.int64)
+    for i in range(n_active):
+        window_end = width - n_active + i
+        in_window = (columns >= window_starts[:, None]) & (columns <= window_end)
+
+        picked = np.argmax(np.where(in_window, battery_banks, -1), axis=1)
+        joltages = joltages * 10 + battery_banks[banks, picked].astype(np.int64)
+        window_starts = picked + 1
+
+    return joltages
+
+
+def part1(battery_banks: np.ndarray | None = None):
+    if battery_banks is None:
+        battery_banks = read_battery_banks()
+
+    sum_joltage = int(compute_max_joltages(battery_banks, 2).sum())
 
     print(f"Part 1 sum max joltage: {sum_joltage}")
 
 
-def part2():
-    sum_joltage = 0
-    for battery_bank in IN_FILE.open("r"):
-        # Strip any trailing newlines
-        battery_bank = battery_bank.rstrip("\n")
-        sum_joltage += compute_max_joltage(map(int, battery_bank), 12)
+def part2(battery_banks: np.ndarray | None = None):
+    if battery_banks is None:
+        battery_banks = read_battery_banks()
+
+    sum_joltage = int(compute_max_joltages(battery_banks, 12).sum())
 
     print(f"Part 2 sum max joltage: {sum_joltage}")
 
 
+def check_max_joltage(n_trials: int = 10_000, seed: int = 0):
+    """Cross-check `compute_max_joltage` against the backtracking reference on random banks."""
+    rng = random.Random(seed)
+    for _ in range(n_trials):
+        battery_bank = [rng.randint(1, 9) for _ in range(rng.randint(1, 100))]
+
+        # The reference backtracks exponentially when nearly every battery is active,
+        # so stay within the puzzle's own range of `n_active`
+        n_active = rng.randint(1, min(12, len(battery_bank)))
+
+        expected = compute_max_joltage_backtracking(battery_bank, n_active)
+        actual = compute_max_joltage(battery_bank, n_active)
+        assert actual == expected, (battery_bank, n_active, actual, expected)
+
+    print(f"All {n_trials} random battery banks agree")
+
+
 if __name__ == "__main__":
-    part1()
-    part2()
+    # Load the input once for both parts
+    battery_banks = read_battery_banks()
+    part1(battery_banks)
+    part2(battery_banks)
@@ -1,53 +1,48 @@
 from pathlib import Path
 
+import numpy as np
+
 # IN_FILE = Path("./demo_input.txt")
 IN_FILE = Path("./full_input.txt")
 
 
-def move_paper(grid: list[list[str]], *, remove: bool = False) -> int:
-    # Search directions (dx, dy)
-    directions = [(-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1)]
+def read_grid() -> np.ndarray:
+    """The grid as a boolean array that is `True` wherever there is a paper roll."""
+    rows = IN_FILE.read_text().splitlines()
+    cells = np.frombuffer("".join(rows).encode(), dtype=np.uint8).reshape(len(rows), -1)
+    return cells == ord("@")
 
-    grid_height = len(grid)
-    grid_width = len(grid[0])
 
-    # Compute the number of move-able paper rolls
-    n_moveable = 0
-    for y in range(grid_height):
-        for x in range(grid_width):
-            # Skip if we currently are not on a paper roll
-            if grid[y][x] != "@":
-                continue
+def count_neighbors(grid: np.ndarray) -> np.ndarray:
+    """The number of paper rolls around every cell, out of its 8 neighbors."""
+    grid_height, grid_width = grid.shape
 
-            n_neighbors = 0
-            for dx, dy in directions:
-                x_offset = x + dx
-                y_offset = y + dy
+    # Pad the grid with empty cells so that every neighbor is in bounds
+    padded = np.pad(grid, 1).astype(np.uint8)
+
+    n_neighbors = np.zeros(grid.shape, dtype=np.uint8)
+    for dy in (-1, 0, 1):
+        for dx in (-1, 0, 1):
+            if dx == dy == 0:
+                continue
+            n_neighbors += padded[1 + dy : 1 + dy + grid_height, 1 + dx : 1 + dx + grid_width]
 
-                # Out of bounds, skip
-                if not ((0 <= x_offset < grid_width) and (0 <= y_offset < grid_height)):
-                    continue
+    return n_neighbors
 
-                if grid[y_offset][x_offset] == "@":
-                    n_neighbors += 1
 
-            if n_neighbors < 4:
-                n_moveable += 1
+def move_paper(grid: np.ndarray, *, remove: bool = False) -> int:
+    # The paper rolls with fewer than 4 neighbors are move-able
+    moveable = grid & (count_neighbors(grid) < 4)
 
-                # Mark the current paper as removed
-                if remove:
-                    grid[y][x] = "."
+    # Mark the moved paper as removed
+    if remove:
+        grid &= ~moveable
 
-    return n_moveable
+    return int(moveable.sum())
 
 
 def part1():
-    # Create the full grid
-    grid = []
-    for paper_rolls in IN_FILE.open("r"):
-        # Add a new row
-        row = list(paper_rolls.rstrip("\n"))
-        grid.append(row)
+    grid = read_grid()
 
     n_moveable = move_paper(grid)
 
@@ -55,12 +50,7 @@ def part1():
 
 
 def part2():
-    # Create the full grid
-    grid = []
-    for paper_rolls in IN_FILE.open("r"):
-        # Add a new row
-        row = list(paper_rolls.rstrip("\n"))
-        grid.append(row)
+    grid = read_grid()
 
     n_moveable = 0
     while n_moved := move_paper(grid, remove=True):
@@ -1,31 +1,78 @@
 import heapq
+import math
 import operator
 import re
-from collections import namedtuple
+from collections import defaultdict, namedtuple
+from collections.abc import Iterator
 from functools import reduce
-from itertools import combinations
+from itertools import product
 from pathlib import Path
 
+import numpy as np
+
 # IN_FILE = Path("./demo_input.txt")
 # N_CONNECTIONS = 10
 
 IN_FILE = Path("./full_input.txt")
 N_CONNECTIONS = 1000
 
+# Average number of junction boxes per cell of the spatial index
+BOXES_PER_CELL = 2
+
+# Number of pairwise distances computed at once by `shortest_edges`
+DISTANCE_BLOCK = 1 << 20
+
+# Part 2 uses Prim's algorithm up to this many junction boxes, Kruskal's beyond
+PRIM_MAX_BOXES = 20_000
+
 Point = namedtuple("Point", ["x", "y", "z"])
 
 
-def compute_euclidean_distance_sq(p1: Point, p2: Point) -> int:
-    """Computes the euclidean distance squared used for sorting.
+class DisjointSet:
+    """Union-find over the IDs `0..n-1` with union by size and path compression."""
+
+    def __init__(self, n: int):
+        self.parents = list(range(n))
+        self.sizes = [1] * n
+        self.n_components = n
+
+    def find(self, x: int) -> int:
+        root = x
+        while self.parents[root] != root:
+            root = self.parents[root]
+
+        # Point everything along the way directly at the `root`
+        while self.parents[x] != root:
+            self.parents[x], x = root, self.parents[x]
 
-    Return an int since all of the point coordinates are integers."""
-    return (p2.x - p1.x) ** 2 + (p2.y - p1.y) ** 2 + (p2.z - p1.z) ** 2
+        return root
 
+    def union(self, x: int, y: int) -> bool:
+        """Join the components of `x` and `y`. Returns `False` if they already were one."""
+        root_x = self.find(x)
+        root_y = self.find(y)
+        if root_x == root_y:
+            return False
 
-def populate_primitives() -> tuple[list[tuple[int, Point, Point]], list[set[Point]]]:
+        # Hang the smaller component under the larger one
+        if self.sizes[root_x] < self.sizes[root_y]:
+            root_x, root_y = root_y, root_x
+
+        self.parents[root_y] = root_x
+        self.sizes[root_x] += self.sizes[root_y]
+        self.n_components -= 1
+        return True
+
+    def component_sizes(self) -> list[int]:
+        return [self.sizes[x] for x in range(len(self.parents)) if self.parents[x] == x]
+
+
+def read_input_data() -> tuple[list[Point], list[int]]:
+    """Read the junction boxes, returning them along with their line numbers in the input.
+
+    The junction boxes are identified by their rank in sorted order. Comparing IDs then
+    compares the points themselves, which keeps the order of equal distances stable."""
     points = []
-    distances = []
-    circuits = []
     with IN_FILE.open("r") as f:
         for line in f:
             match = re.match(r"(\d+),(\d+),(\d+)", line)
@@ -36,71 +83,244 @@ def populate_primitives() -> tuple[list[tuple[int, Point, Point]], list[set[Poin
 
             points.append(Point(x, y, z))
 
-    # Initially add all junction boxes as single size circuits
-    for point in points:
-        circuits.append({point})
+    line_numbers = sorted(range(len(points)), key=points.__getitem__)
+    boxes = [points[i] for i in line_numbers]
 
-    # For all point X point combinations
-    for p1, p2 in combinations(points, 2):
-        dist = compute_euclidean_distance_sq(p1, p2)
+    return boxes, line_numbers
 
-        # Treat `distances` as a min heap
-        heapq.heappush(distances, (dist, p1, p2))
 
-    return distances, circuits
+class GridBuckets:
+    """The junction box IDs bucketed in to a uniform grid of cubic cells."""
 
+    def __init__(self, coords: np.ndarray):
+        self.coords = coords
+        self.origin = coords.min(axis=0)
+        extent = (coords.max(axis=0) - self.origin + 1).astype(float)
 
-def part1():
-    distances, circuits = populate_primitives()
+        # Size the cells to hold about `BOXES_PER_CELL` junction boxes on average
+        cell_volume = extent.prod() * BOXES_PER_CELL / len(coords)
+        self.cell_size = max(1, math.ceil(cell_volume ** (1 / 3)))
 
-    for _ in range(N_CONNECTIONS):
-        # Get the next shortest distance
-        _, p1, p2 = heapq.heappop(distances)
+        self.cells = (coords - self.origin) // self.cell_size
+        self.grid_shape = self.cells.max(axis=0) + 1
+
+        buckets = defaultdict(list)
+        for box_id, cell in enumerate(map(tuple, self.cells.tolist())):
+            buckets[cell].append(box_id)
+        self.buckets = {cell: np.array(ids, dtype=np.int64) for cell, ids in buckets.items()}
+
+    def within(self, box_id: int, radius: int) -> tuple[np.ndarray, bool]:
+        """The IDs in the cells at most `radius` cells away from the cell of `box_id`.
+
+        Every junction box closer than `radius * self.cell_size` is among them. Also
+        returns whether the cells cover the whole grid, in which case that is everyone."""
+        lo = np.maximum(self.cells[box_id] - radius, 0)
+        hi = np.minimum(self.cells[box_id] + radius, self.grid_shape - 1)
+        if not lo.any() and (hi == self.grid_shape - 1).all():
+            return np.arange(len(self.coords), dtype=np.int64), True
+
+        found = [
+            self.buckets[cell]
+            for cell in product(*(range(a, b + 1) for a, b in zip(lo, hi, strict=True)))
+            if cell in self.buckets
+        ]
+        return np.concatenate(found), False
+
+
+def candidate_edges(boxes: list[Point], line_numbers: list[int]) -> Iterator[tuple[int, int, int]]:
+    """Yield `(distance squared, box ID, box ID)` for every pair in increasing order.
+
+    Equal distances come out in the same order as from a heap of every pair, with each
+    pair's IDs ordered by their line number. The pairs are never all materialized:
+    each junction box lazily streams its partners from a widening neighbourhood in
+    `GridBuckets`, and only every box's next partner is kept in a heap."""
+    coords = np.array(boxes, dtype=np.int64)
+    box_lines = np.array(line_numbers, dtype=np.int64)
+    grid = GridBuckets(coords)
+
+    def partner_stream(anchor: int) -> Iterator[tuple[int, int]]:
+        """Yield `(distance squared, partner)` for the `anchor` in increasing order."""
+        emitted_up_to = -1
+        radius = 1
+        while True:
+            partners, everyone = grid.within(anchor, radius)
+
+            # Only keep the pairs where the `anchor` came first in the input so
+            # that every pair is yielded exactly once
+            partners = partners[box_lines[partners] > box_lines[anchor]]
+            dists = ((coords[partners] - coords[anchor]) ** 2).sum(axis=1)
+
+            # Distances up to the searched radius are complete. Anything beyond it may
+            # still be missing some closer partner from outside of the searched cells
+            limit = math.inf if everyone else (radius * grid.cell_size) ** 2
+            keep = (dists > emitted_up_to) & (dists <= limit)
+            partners = partners[keep]
+            dists = dists[keep]
+
+            order = np.lexsort((partners, dists))
+            yield from zip(dists[order].tolist(), partners[order].tolist(), strict=True)
+
+            if everyone:
+                return
+
+            emitted_up_to = limit
+            radius *= 2
+
+    streams = [partner_stream(anchor) for anchor in range(len(boxes))]
+
+    # Treat `heap` as a min heap holding every anchor's next closest partner
+    heap = []
+    for anchor, stream in enumerate(streams):
+        if (entry := next(stream, None)) is not None:
+            heap.append((entry[0], anchor, entry[1]))
+    heapq.heapify(heap)
+
+    while heap:
+        dist, anchor, partner = heap[0]
+        yield dist, anchor, partner
+
+        if (entry := next(streams[anchor], None)) is not None:
+            heapq.heapreplace(heap, (entry[0], anchor, entry[1]))
+        else:
+            heapq.heappop(heap)
+
+
+def shortest_edges(
+    boxes: list[Point], line_numbers: list[int], n_edges: int
+) -> list[tuple[int, int, int]]:
+    """The first `n_edges` of `candidate_edges`, computed in bulk with NumPy.
+
+    The squared distances are computed a block of rows at a time, and `np.argpartition`
+    keeps only the candidates no farther than the `n_edges`-th smallest distance so far.
+    Ties at that distance are all kept until the final stable sort picks among them."""
+    coords = np.array(boxes, dtype=np.int64)
+    box_lines = np.array(line_numbers, dtype=np.int64)
+    n = len(boxes)
+
+    best_dists = np.zeros(0, dtype=np.int64)
+    best_b1 = np.zeros(0, dtype=np.int64)
+    best_b2 = np.zeros(0, dtype=np.int64)
+
+    block_rows = max(1, DISTANCE_BLOCK // max(n, 1))
+    for start in range(0, n, block_rows):
+        rows = np.arange(start, min(start + block_rows, n))
+        dists = ((coords[rows, None, :] - coords[None, :, :]) ** 2).sum(axis=2)
+
+        # Every pair once, with its IDs ordered by their line number
+        b1, b2 = np.nonzero(box_lines[rows, None] < box_lines[None, :])
+        b1 = rows[b1]
+
+        best_dists = np.concatenate([best_dists, dists[b1 - start, b2]])
+        best_b1 = np.concatenate([best_b1, b1])
+        best_b2 = np.concatenate([best_b2, b2])
+
+        # Drop everything farther than the `n_edges`-th smallest distance
+        if len(best_dists) > n_edges:
+            threshold = best_dists[np.argpartition(best_dists, n_edges - 1)[n_edges - 1]]
+            keep = best_dists <= threshold
+            best_dists, best_b1, best_b2 = best_dists[keep], best_b1[keep], best_b2[keep]
+
+    order = np.lexsort((best_b2, best_b1, best_dists))[:n_edges]
+    return list(
+        zip(
+            best_dists[order].tolist(),
+            best_b1[order].tolist(),
+            best_b2[order].tolist(),
+            strict=True,
+        )
+    )
 
-        # Connect the circuits with p1 and p2
-        circuit1 = next(c for c in circuits if p1 in c)
-        circuit2 = next(c for c in circuits if p2 in c)
 
-        # The points are already in the same circuit, do nothing!
-        if circuit1 is circuit2:
-            continue
+def part1():
+    boxes, line_numbers = read_input_data()
 
-        # Join these two circuits
-        circuits.append(circuit1 | circuit2)
-        circuits.remove(circuit1)
-        circuits.remove(circuit2)
+    # Initially all junction boxes are single size circuits
+    circuits = DisjointSet(len(boxes))
+
+    # Only the `N_CONNECTIONS` shortest distances matter, so compute them in bulk
+    for _, b1, b2 in shortest_edges(boxes, line_numbers, N_CONNECTIONS):
+        # Connect the circuits with b1 and b2
+        circuits.union(b1, b2)
 
     # Find the sizes of the top 3 circuits
-    top3 = sorted(map(len, circuits), reverse=True)[:3]
+    top3 = sorted(circuits.component_sizes(), reverse=True)[:3]
 
     print(f"Part 1 top three product: {reduce(operator.mul, top3, 1)}")
 
 
-def part2():
-    distances, circuits = populate_primitives()
+def kruskal_last_edge(boxes: list[Point], line_numbers: list[int]) -> tuple[int, int]:
+    """Kruskal's algorithm over the lazily sorted `candidate_edges`.
+
+    Returns the edge that joins everything in to one circuit, stopping right at it."""
+    circuits = DisjointSet(len(boxes))
+    for _, b1, b2 in candidate_edges(boxes, line_numbers):
+        if circuits.union(b1, b2) and circuits.n_components == 1:
+            return b1, b2
+
+    # There should always be a final connection
+    raise AssertionError()
+
+
+def prim_last_edge(boxes: list[Point], line_numbers: list[int]) -> tuple[int, int]:
+    """Prim's algorithm, computing one vectorized row of distances per added junction box.
+
+    Edges are totally ordered by `(distance squared, box ID, box ID)` just as they come out
+    of `candidate_edges`, so the minimum spanning tree is unique. The last edge Kruskal
+    would accept is then the largest edge of that tree."""
+    n = len(boxes)
+    coords = np.array(boxes, dtype=np.int64)
+    box_lines = np.array(line_numbers, dtype=np.int64)
+    box_ids = np.arange(n, dtype=np.int64)
+    no_edge = np.iinfo(np.int64).max
 
-    last_connection = None
-    while len(circuits) > 1:
-        # Get the next shortest distance
-        _, p1, p2 = heapq.heappop(distances)
-        last_connection = (p1, p2)
+    in_tree = np.zeros(n, dtype=bool)
+    best_dists = np.full(n, no_edge, dtype=np.int64)
+    best_b1 = np.zeros(n, dtype=np.int64)
+    best_b2 = np.zeros(n, dtype=np.int64)
 
-        # Connect the circuits with p1 and p2
-        circuit1 = next(c for c in circuits if p1 in c)
-        circuit2 = next(c for c in circuits if p2 in c)
+    last_edge = None
+    added = 0
+    for _ in range(n - 1):
+        in_tree[added] = True
 
-        # The points are already in the same circuit, do nothing!
-        if circuit1 is circuit2:
-            continue
+        # Edges from the `added` box, with their IDs ordered by their line number
+        dists = ((coords - coords[added]) ** 2).sum(axis=1)
+        added_first = box_lines[added] < box_lines
+        b1 = np.where(added_first, added, box_ids)
+        b2 = np.where(added_first, box_ids, added)
 
-        # Join these two circuits
-        circuits.append(circuit1 | circuit2)
-        circuits.remove(circuit1)
-        circuits.remove(circuit2)
+        better = ~in_tree & (
+            (dists < best_dists)
+            | ((dists == best_dists) & ((b1 < best_b1) | ((b1 == best_b1) & (b2 < best_b2))))
+        )
+        best_dists[better] = dists[better]
+        best_b1[better] = b1[better]
+        best_b2[better] = b2[better]
+
+        # Add the box with the smallest edge to the tree, breaking ties by the IDs
+        candidate_dists = np.where(in_tree, no_edge, best_dists)
+        candidates = np.flatnonzero(candidate_dists == candidate_dists.min())
+        added = int(candidates[np.lexsort((best_b2[candidates], best_b1[candidates]))[0]])
+
+        edge = (int(best_dists[added]), int(best_b1[added]), int(best_b2[added]))
+        if last_edge is None or edge > last_edge:
+            last_edge = edge
+
+    assert last_edge
+    return last_edge[1], last_edge[2]
+
+
+def part2():
+    boxes, line_numbers = read_input_data()
 
-    assert last_connection
+    # Prim's algorithm does O(n^2) vectorized work, so switch to Kruskal's over
+    # the lazily generated edges when there are too many junction boxes
+    if len(boxes) <= PRIM_MAX_BOXES:
+        b1, b2 = prim_last_edge(boxes, line_numbers)
+    else:
+        b1, b2 = kruskal_last_edge(boxes, line_numbers)
 
-    print(f"Part 2 X coord product: {last_connection[0].x * last_connection[1].x}")
+    print(f"Part 2 X coord product: {boxes[b1].x * boxes[b2].x}")
 
 
 if __name__ == "__main__":
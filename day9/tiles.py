@@ -1,26 +1,46 @@
+import heapq
 import math
-import random
 import re
+from bisect import bisect_left, bisect_right
 from collections import namedtuple
 from collections.abc import Iterator
-from functools import lru_cache
-from itertools import combinations
 from pathlib import Path
 from typing import cast
 
+import numpy as np
+
 # IN_FILE = Path("./demo_input.txt")
 IN_FILE = Path("./full_input.txt")
 
+# Print the part 2 search progress once every this many rectangles
+PROGRESS_EVERY = 10_000
+
+# Side length of the blocks of point pairs whose areas are computed at once
+AREA_TILE = 1024
+
 Point = namedtuple("Point", ["x", "y"])
 type Edge = tuple[Point, Point]
 
-random.seed(42)
+# Sorted flat keys over the polygon's edges that answer point queries by bisection.
+# A key packs two coordinates as `major * stride + minor`
+EdgeIndex = namedtuple(
+    "EdgeIndex",
+    [
+        "stride",
+        "h_keys",
+        "h_ends",
+        "v_keys",
+        "v_ends",
+        "slab_ys",
+        "n_leaves",
+        "node_starts",
+        "node_keys",
+    ],
+)
 
 
 class Polygon:
     def __init__(self):
-        self.is_point_inside = lru_cache(maxsize=None)(self._is_point_inside)
-
         self.h_edges = []
         self.v_edges = []
 
@@ -29,6 +49,10 @@ class Polygon:
         self.min_y = math.inf
         self.max_y = -1
 
+        # Built lazily on the first query, after all of the edges are added
+        self._index = None
+        self._index_arrays = None
+
     @staticmethod
     def stably_sort_edge(p1: Point, p2: Point) -> Edge:
         # Pick the point with the smaller x. If a tie, pick the smaller y
@@ -51,7 +75,66 @@ class Polygon:
         self.min_y = min([self.min_y, edge[0].y])
         self.max_y = max([self.max_y, edge[1].y])
 
-    def _is_point_inside(self, test_point: Point) -> bool:
+        # Any existing index is now stale
+        self._index = None
+        self._index_arrays = None
+
+    def _get_index(self) -> EdgeIndex:
+        if self._index is not None:
+            return self._index
+
+        # Every coordinate inside of the bounding box is less than `stride`
+        stride = max(self.max_x, self.max_y) + 1
+
+        # Horizontal edges keyed on (y, left x) and vertical edges keyed on (x, top y). Edges
+        # on the same line never overlap, so the on-edge candidate is the last key <= the query
+        h_edges = sorted((e[0].y * stride + e[0].x, e[1].x) for e in self.h_edges)
+        v_edges = sorted((e[0].x * stride + e[0].y, e[1].y) for e in self.v_edges)
+
+        # Cut the plane in to horizontal slabs at every vertical edge endpoint. A vertical
+        # edge either spans a run of slabs fully or not at all, so the leftward ray of a point
+        # only needs the x coordinates of the edges spanning its slab
+        slab_ys = sorted({e[0].y for e in self.v_edges} | {e[1].y for e in self.v_edges})
+        slab_of = {y: slab for slab, y in enumerate(slab_ys)}
+
+        # Listing the edges of every slab takes O(V^2) space when many long edges overlap.
+        # So the slabs are the leaves of a segment tree instead, where node `n` has the
+        # children `2n` and `2n + 1`. Every edge is stored once at each of the O(log V) nodes
+        # covering its run of slabs, and the edges spanning a slab are those on its leaf to
+        # root path. Each node's x coordinates are keyed on (node, x)
+        n_leaves = 1 << max(len(slab_ys) - 2, 0).bit_length()
+        node_keys = []
+        for e in self.v_edges:
+            lo = slab_of[e[0].y] + n_leaves
+            hi = slab_of[e[1].y] + n_leaves
+            while lo < hi:
+                if lo & 1:
+                    node_keys.append(lo * stride + e[0].x)
+                    lo += 1
+                if hi & 1:
+                    hi -= 1
+                    node_keys.append(hi * stride + e[0].x)
+                lo >>= 1
+                hi >>= 1
+        node_keys.sort()
+
+        # `node_keys[node_starts[n] : node_starts[n + 1]]` are the keys of node `n`
+        node_starts = [bisect_left(node_keys, node * stride) for node in range(2 * n_leaves + 1)]
+
+        self._index = EdgeIndex(
+            stride,
+            [k for k, _ in h_edges],
+            [end for _, end in h_edges],
+            [k for k, _ in v_edges],
+            [end for _, end in v_edges],
+            slab_ys,
+            n_leaves,
+            node_starts,
+            node_keys,
+        )
+        return self._index
+
+    def is_point_inside(self, test_point: Point) -> bool:
         # Short circuit test if the point is outside of the rectangular bounding box
         if (
             test_point.x < self.min_x
@@ -61,25 +144,73 @@ class Polygon:
         ):
             return False
 
-        # Next test if the point is on an edge, which counts as being inside
-        for h_edge in self.h_edges:
-            if h_edge[0].y == test_point.y and h_edge[0].x <= test_point.x <= h_edge[1].x:
-                return True
-
-        for v_edge in self.v_edges:
-            if v_edge[0].x == test_point.x and v_edge[0].y <= test_point.y <= v_edge[1].y:
-                return True
+        index = self._get_index()
+        stride = index.stride
 
-        # Keep a parity counter which will toggle with each intersection of the vertical edge
-        inside = False
-        for v_edge in self.v_edges:
-            # This will only hit the leftward rays. To prevent double counting,
-            # consider edges half-open ignoring the top
-            if v_edge[0].x < test_point.x and v_edge[0].y <= test_point.y < v_edge[1].y:
-                # Toggle the `inside` parity
-                inside = not inside
+        # Next test if the point is on an edge, which counts as being inside
+        i = bisect_right(index.h_keys, test_point.y * stride + test_point.x) - 1
+        if i >= 0 and index.h_keys[i] // stride == test_point.y and test_point.x <= index.h_ends[i]:
+            return True
+
+        i = bisect_right(index.v_keys, test_point.x * stride + test_point.y) - 1
+        if i >= 0 and index.v_keys[i] // stride == test_point.x and test_point.y <= index.v_ends[i]:
+            return True
+
+        # The parity of the vertical edges crossed by the leftward ray. Slabs are
+        # half-open ignoring the top to prevent double counting
+        slab = bisect_right(index.slab_ys, test_point.y) - 1
+        if not 0 <= slab < len(index.slab_ys) - 1:
+            return False
 
-        return inside
+        n_crossed = 0
+        node = slab + index.n_leaves
+        while node:
+            n_crossed += bisect_left(index.node_keys, node * stride + test_point.x)
+            n_crossed -= index.node_starts[node]
+            node >>= 1
+
+        return bool(n_crossed % 2)
+
+    def are_points_inside(self, points: np.ndarray) -> np.ndarray:
+        """Vectorized `is_point_inside` over an `(n, 2)` array of `(x, y)` points."""
+        index = self._get_index()
+        if self._index_arrays is None:
+            self._index_arrays = index._replace(
+                **{
+                    field: np.asarray(getattr(index, field), dtype=np.int64)
+                    for field in EdgeIndex._fields
+                    if field not in ("stride", "n_leaves")
+                }
+            )
+        arrays = self._index_arrays
+        stride = arrays.stride
+
+        xs = points[:, 0].astype(np.int64)
+        ys = points[:, 1].astype(np.int64)
+        in_bbox = (xs >= self.min_x) & (xs <= self.max_x) & (ys >= self.min_y) & (ys <= self.max_y)
+
+        def on_edges(keys: np.ndarray, ends: np.ndarray, major: np.ndarray, minor: np.ndarray):
+            i = np.searchsorted(keys, major * stride + minor, side="right") - 1
+            i_safe = np.maximum(i, 0)
+            return (i >= 0) & (keys[i_safe] // stride == major) & (minor <= ends[i_safe])
+
+        on_edge = on_edges(arrays.h_keys, arrays.h_ends, ys, xs) | on_edges(
+            arrays.v_keys, arrays.v_ends, xs, ys
+        )
+
+        slab = np.searchsorted(arrays.slab_ys, ys, side="right") - 1
+        in_slabs = (slab >= 0) & (slab < len(arrays.slab_ys) - 1)
+
+        # Walk every point's leaf to root path in the slab tree one level at a time
+        n_crossed = np.zeros(len(points), dtype=np.int64)
+        node = np.clip(slab, 0, arrays.n_leaves - 1) + arrays.n_leaves
+        while node.any():
+            n_crossed += np.searchsorted(arrays.node_keys, node * stride + xs)
+            n_crossed -= arrays.node_starts[node]
+            node >>= 1
+        odd_parity = in_slabs & (n_crossed % 2 == 1)
+
+        return in_bbox & (on_edge | odd_parity)
 
 
 # Make this take one argument for easier mapping
@@ -89,32 +220,141 @@ def compute_area(points: tuple[Point, Point]) -> int:
     return (abs(p2.x - p1.x) + 1) * (abs(p2.y - p1.y) + 1)
 
 
-def trace_edges(points: tuple[Point, Point]) -> Iterator[Point]:
-    """Yield all of the points on the edges of the rectangle formed by `points`."""
-    # Convert `points` in to a top left and bottom right point `p1` and `p2` respectively
-    p1 = Point(min(p.x for p in points), min(p.y for p in points))
-    p2 = Point(max(p.x for p in points), max(p.y for p in points))
+def max_cross_area(corners_a: np.ndarray, corners_b: np.ndarray) -> int:
+    """The largest rectangle area with one corner from each `(n, 2)` array of points.
+
+    The pairs are broadcast in blocks of at most `AREA_TILE` by `AREA_TILE` so that
+    the memory use stays fixed no matter how many points there are."""
+    best = 0
+    for i in range(0, len(corners_a), AREA_TILE):
+        tile_a = corners_a[i : i + AREA_TILE]
+        for j in range(0, len(corners_b), AREA_TILE):
+            tile_b = corners_b[j : j + AREA_TILE]
+
+            # Add 1 since side lengths start from 1
+            widths = np.abs(tile_a[:, None, 0] - tile_b[None, :, 0]) + 1
+            heights = np.abs(tile_a[:, None, 1] - tile_b[None, :, 1]) + 1
+            best = max(best, int((widths * heights).max()))
+
+    return best
+
+
+def staircase(corners: np.ndarray, *, flip_x: bool, flip_y: bool) -> np.ndarray:
+    """The points not dominated towards a corner of the plane, the lower left one by default.
+
+    Moving a rectangle's corner further out towards its side of the plane never shrinks it,
+    so the largest rectangle always has its corners on these staircases."""
+    signed = corners * np.array([-1 if flip_x else 1, -1 if flip_y else 1])
+
+    # Sweep from left to right, keeping the points lower than all of those before them
+    order = np.lexsort((signed[:, 1], signed[:, 0]))
+    ys = signed[order, 1]
+    lowest_before = np.minimum.accumulate(np.concatenate([[np.iinfo(np.int64).max], ys[:-1]]))
+
+    return corners[order[ys < lowest_before]]
+
 
-    dx = p2.x - p1.x
-    dy = p2.y - p1.y
+def max_rectangle_area(corners: np.ndarray, *, prune: bool = True) -> int:
+    """The largest rectangle area over every two points of an `(n, 2)` array of points.
 
-    # Yield the corners first since they have high likelihood of being outside of the polygon
-    yield p1
-    yield Point(p1.x, p1.y + dy)
-    yield p2
-    yield Point(p1.x + dx, p1.y)
+    With `prune`, only the opposing staircases of extreme points are paired up, which are
+    typically a tiny fraction of the points."""
+    if not prune:
+        return max_cross_area(corners, corners)
 
-    # Iterate the rest of the edges picking random points in [1, dx) X [1, dy) space
-    diffs = (
-        [(0, diffy) for diffy in range(1, dy)]
-        + [(diffx, dy) for diffx in range(1, dx)]
-        + [(dx, dy - diffy) for diffy in range(1, dy)]
-        + [(dx - diffx, 0) for diffx in range(1, dx)]
-    )
-    random.shuffle(diffs)
+    lower_left = staircase(corners, flip_x=False, flip_y=False)
+    upper_right = staircase(corners, flip_x=True, flip_y=True)
+    upper_left = staircase(corners, flip_x=False, flip_y=True)
+    lower_right = staircase(corners, flip_x=True, flip_y=False)
 
-    for diffx, diffy in diffs:
-        yield Point(p1.x + diffx, p1.y + diffy)
+    return max(max_cross_area(lower_left, upper_right), max_cross_area(upper_left, lower_right))
+
+
+def rectangles_by_area(points: list[Point]) -> Iterator[tuple[Point, Point]]:
+    """Lazily yield every two points combination from the largest to the smallest area.
+
+    Every anchor point keeps only its next best partner in a max heap, which is found by
+    a vectorized scan over the anchor's row of areas when needed. Pairs are totally ordered
+    by `area * n + partner index`, so equal areas never skip or repeat a partner."""
+    n = len(points)
+    xs = np.array([p.x for p in points], dtype=np.int64)
+    ys = np.array([p.y for p in points], dtype=np.int64)
+    indices = np.arange(n, dtype=np.int64)
+
+    def next_partner(anchor: int, below_key: float) -> int | None:
+        """The largest pair key of `anchor` that is less than `below_key`, if any."""
+        # Only consider the partners after the `anchor` so that each pair appears once
+        partners = indices[anchor + 1 :]
+        areas = (np.abs(xs[partners] - xs[anchor]) + 1) * (np.abs(ys[partners] - ys[anchor]) + 1)
+        keys = areas * n + partners
+        keys = keys[keys < below_key]
+        return int(keys.max()) if len(keys) else None
+
+    heap = []
+    for anchor in range(n - 1):
+        if (key := next_partner(anchor, math.inf)) is not None:
+            heap.append((-key, anchor))
+    heapq.heapify(heap)
+
+    while heap:
+        neg_key, anchor = heapq.heappop(heap)
+        yield points[anchor], points[-neg_key % n]
+
+        if (key := next_partner(anchor, -neg_key)) is not None:
+            heapq.heappush(heap, (-key, anchor))
+
+
+class CompressedGrid:
+    """Inside/outside of a `Polygon` over coordinate-compressed cells, with a 2D prefix sum.
+
+    Every vertex coordinate is its own cell and so is every gap between two consecutive
+    ones. The polygon's edges only lie on vertex coordinates, so each cell is either fully
+    inside or fully outside and one representative point classifies it."""
+
+    def __init__(self, polygon: Polygon):
+        edges = polygon.h_edges + polygon.v_edges
+        x_reps, self.x_cell = self._compress({p.x for edge in edges for p in edge})
+        y_reps, self.y_cell = self._compress({p.y for edge in edges for p in edge})
+
+        # Classify all of the cells in one batch query, indexed as `[x cell, y cell]`
+        grid_xs, grid_ys = np.meshgrid(x_reps, y_reps, indexing="ij")
+        inside = polygon.are_points_inside(np.column_stack([grid_xs.ravel(), grid_ys.ravel()]))
+        inside = inside.reshape(len(x_reps), len(y_reps))
+
+        # `self.prefix[i, j]` is the number of inside cells in `[0, i) X [0, j)`
+        self.prefix = np.zeros((len(x_reps) + 1, len(y_reps) + 1), dtype=np.int64)
+        self.prefix[1:, 1:] = inside.cumsum(axis=0).cumsum(axis=1)
+
+    @staticmethod
+    def _compress(coords: set[int]) -> tuple[list[int], dict[int, int]]:
+        """Returns a representative of every cell and the cell index of every coordinate."""
+        reps = []
+        cell_of = {}
+        sorted_coords = sorted(coords)
+        # The last coordinate is paired with itself since there is no gap after it
+        for c, next_c in zip(sorted_coords, sorted_coords[1:] + sorted_coords[-1:], strict=True):
+            cell_of[c] = len(reps)
+            reps.append(c)
+
+            # The gap up to the next coordinate, if there is one
+            if next_c - c > 1:
+                reps.append(c + 1)
+
+        return reps, cell_of
+
+    def is_rectangle_inside(self, points: tuple[Point, Point]) -> bool:
+        """Check in O(1) if the rectangle with the vertex corners `points` is fully inside."""
+        p1, p2 = points
+        x_lo, x_hi = sorted((self.x_cell[p1.x], self.x_cell[p2.x]))
+        y_lo, y_hi = sorted((self.y_cell[p1.y], self.y_cell[p2.y]))
+
+        n_inside = (
+            self.prefix[x_hi + 1, y_hi + 1]
+            - self.prefix[x_lo, y_hi + 1]
+            - self.prefix[x_hi + 1, y_lo]
+            + self.prefix[x_lo, y_lo]
+        )
+        return n_inside == (x_hi - x_lo + 1) * (y_hi - y_lo + 1)
 
 
 def part1():
@@ -125,7 +365,7 @@ def part1():
             assert match
             points.append(Point(int(match.group(1)), int(match.group(2))))
 
-    max_area = max(map(compute_area, combinations(points, 2)))
+    max_area = max_rectangle_area(np.array(points, dtype=np.int64))
     print(f"Part 1 max area: {max_area}")
 
 
@@ -141,15 +381,15 @@ def part2():
     for p1, p2 in zip(points, points[1:] + [points[0]], strict=True):
         polygon.add_edge((p1, p2))
 
+    grid = CompressedGrid(polygon)
+
     # Form a rectangle for every two points combinations, ordered from largest to smallest
-    rectangles = sorted(combinations(points, 2), key=compute_area, reverse=True)
+    n_rectangles = len(points) * (len(points) - 1) // 2
+    for i, rect in enumerate(rectangles_by_area(points)):
+        if not i % PROGRESS_EVERY:
+            print(f"Processed {i} / {n_rectangles}")
 
-    for i, rect in enumerate(rectangles):
-        print(f"Processed {i} / {len(rectangles)}")
-        for point in trace_edges(rect):
-            if not polygon.is_point_inside(point):
-                break
-        else:
+        if grid.is_rectangle_inside(rect):
             print(f"Part 2 max area: {compute_area(rect)}")
             return
 